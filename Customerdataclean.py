@@ -1,9 +1,7 @@
 import pandas as pd
 
-def clean_customer_data(input_csv: str, output_csv: str):
-    # Load the CSV
-    df = pd.read_csv(input_csv, low_memory=False)
-
+def clean_customer_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep customers with valid coordinates inside the UK."""
     # Drop rows where lat or lon is missing
     df = df.dropna(subset=['latitude', 'longitude'])
 
@@ -18,7 +16,12 @@ def clean_customer_data(input_csv: str, output_csv: str):
         df['latitude'].between(49.0, 61.0) &
         df['longitude'].between(-8.0, 2.0)
     )
-    df_uk = df.loc[in_uk].copy()
+    return df.loc[in_uk].copy()
+
+def clean_customer_data(input_csv: str, output_csv: str):
+    # Load the CSV
+    df = pd.read_csv(input_csv, low_memory=False)
+    df_uk = clean_customer_frame(df)
 
     # Output cleaned CSV
     df_uk.to_csv(output_csv, index=False)
@@ -17,25 +17,35 @@ def get_lat_lon(postcode: str):
         print(f"Error fetching location for {postcode}: {e}")
     return None, None
 
-with open('customers_with_postcodes.csv', mode='r', newline='', encoding='utf-8') as file:
-    reader = csv.reader(file)
-    final_data = []
-    for index, row in enumerate(reader):
-        if index == 0:
-            headers = row + ["latitude", "longitude"]
-        else:
-            row_dict = dict(zip(headers[:-2], row))  # exclude lat/lon for now
-            postcode = row_dict.get("postal_code", "")
-            lat, lon = get_lat_lon(postcode)
-            row_dict["latitude"] = lat
-            row_dict["longitude"] = lon
-            final_data.append(row_dict)
-            print(row_dict)
+def geocode_rows(rows):
+    """Add latitude and longitude to each customer row dict by geocoding its postal_code."""
+    for row_dict in rows:
+        postcode = row_dict.get("postal_code", "")
+        lat, lon = get_lat_lon(postcode)
+        row_dict["latitude"] = lat
+        row_dict["longitude"] = lon
+        print(row_dict)
+    return rows
 
-# Write the enriched data to a new CSV
-with open('customers_with_latlon.csv', mode='w', newline='', encoding='utf-8') as outfile:
-    writer = csv.DictWriter(outfile, fieldnames=headers)
-    writer.writeheader()
-    writer.writerows(final_data)
+def enrich_customers(input_csv='customers_with_postcodes.csv', output_csv='customers_with_latlon.csv'):
+    """Geocode every customer in input_csv and write the result with latitude/longitude columns."""
+    with open(input_csv, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        rows = []
+        for index, row in enumerate(reader):
+            if index == 0:
+                headers = row + ["latitude", "longitude"]
+            else:
+                rows.append(dict(zip(headers[:-2], row)))  # exclude lat/lon for now
+        final_data = geocode_rows(rows)
 
-print("Enriched dataset saved to 'customers_with_latlon.csv'")
\ No newline at end of file
+    # Write the enriched data to a new CSV
+    with open(output_csv, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(final_data)
+
+    print(f"Enriched dataset saved to '{output_csv}'")
+
+if __name__ == '__main__':
+    enrich_customers()
@@ -0,0 +1,205 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.neighbors import BallTree
+from assignment_index import factorize_coordinates
+
+EARTH_RADIUS_KM = 6371.0088
+RASTER_FILE = 'accessibility_raster.npy'
+RASTER_META_FILE = 'accessibility_raster.json'
+RASTER_COLORS = ['#d73027', '#ffffbf', '#1a9850']  # poor -> good access
+
+def distance_decay(distance_km, catchment_km, decay='gaussian'):
+    """
+    Weight of a clinic at the given distance.
+
+    'gaussian' falls smoothly from 1 at the clinic to 0 at the catchment edge;
+    'uniform' weights every clinic inside the catchment equally (classic 2SFCA).
+    """
+    if decay == 'uniform':
+        return np.ones_like(distance_km)
+    edge = np.exp(-0.5)
+    return (np.exp(-0.5 * (distance_km / catchment_km) ** 2) - edge) / (1 - edge)
+
+def build_weight_matrix(location_lat, location_lon, clinic_lat, clinic_lon, catchment_km,
+                        decay='gaussian', chunk_size=1000):
+    """
+    Build the sparse locations × clinics distance-decay weight matrix.
+
+    A haversine BallTree is built over the locations and queried once per clinic,
+    so the number of Python-level result arrays grows with the clinics rather
+    than with the (much more numerous) customer locations.
+
+    Returns:
+        sp.csr_matrix: float32 weights, zero outside the catchment
+    """
+    if len(location_lat) == 0 or len(clinic_lat) == 0:
+        return sp.csr_matrix((len(location_lat), len(clinic_lat)), dtype=np.float32)
+    tree = BallTree(np.radians(np.column_stack([location_lat, location_lon])), metric='haversine')
+    clinic_points = np.radians(np.column_stack([clinic_lat, clinic_lon]))
+
+    rows, cols, weights = [], [], []
+    for start in range(0, len(clinic_points), chunk_size):
+        neighbours, distances = tree.query_radius(
+            clinic_points[start:start + chunk_size],
+            r=catchment_km / EARTH_RADIUS_KM,
+            return_distance=True
+        )
+        for offset, (idx, dist) in enumerate(zip(neighbours, distances)):
+            rows.append(idx)
+            cols.append(np.full(len(idx), start + offset, dtype=np.int64))
+            weights.append(distance_decay(dist * EARTH_RADIUS_KM, catchment_km, decay).astype(np.float32))
+
+    if rows:
+        rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    return sp.csr_matrix((weights, (rows, cols)), shape=(len(location_lat), len(clinic_points)))
+
+def two_step_fca(weights, demand, supply):
+    """
+    Two-step floating catchment area scores.
+
+    Step 1 rates each clinic by its supply over the distance-weighted demand
+    around it; step 2 sums the weighted ratios of the clinics around each location.
+
+    Args:
+        weights (sparse matrix): Locations × clinics weights from build_weight_matrix
+        demand (np.ndarray): Customers at each location
+        supply (np.ndarray): Weekly availability hours of each clinic
+
+    Returns:
+        tuple: (accessibility per location, supply/demand ratio per clinic)
+    """
+    clinic_demand = weights.T @ np.asarray(demand, dtype=float)
+    clinic_ratio = np.divide(supply, clinic_demand, out=np.zeros(len(clinic_demand)), where=clinic_demand > 0)
+    return weights @ clinic_ratio, clinic_ratio
+
+def accessibility_raster(clinics_df, clinic_ratio, bounds, step_deg, catchment_km, decay='gaussian'):
+    """
+    Accessibility on a regular lat/lon grid, for drawing on the map.
+
+    Returns:
+        tuple: (grid, meta) where grid has shape (n_lat, n_lon) with row 0 at the south;
+        empty if bounds is None (no customers to cover)
+    """
+    if bounds is None:
+        return np.zeros((0, 0)), {'south': 0.0, 'west': 0.0, 'step_deg': float(step_deg), 'n_lat': 0, 'n_lon': 0}
+    south, west, north, east = bounds
+    lats = np.arange(south, north + step_deg, step_deg)
+    lons = np.arange(west, east + step_deg, step_deg)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing='ij')
+
+    weights = build_weight_matrix(
+        grid_lat.ravel(), grid_lon.ravel(),
+        clinics_df['latitude'].to_numpy(), clinics_df['longitude'].to_numpy(),
+        catchment_km, decay
+    )
+    grid = (weights @ clinic_ratio).reshape(grid_lat.shape)
+    meta = {'south': float(south), 'west': float(west), 'step_deg': float(step_deg),
+            'n_lat': len(lats), 'n_lon': len(lons)}
+    return grid, meta
+
+def load_accessibility_raster(raster_path=RASTER_FILE, meta_path=RASTER_META_FILE):
+    """
+    Load the raster saved by main().
+
+    Returns:
+        tuple: (grid, meta) or (None, None) if no non-empty raster has been saved.
+    """
+    if not (os.path.exists(raster_path) and os.path.exists(meta_path)):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    grid = np.load(raster_path)
+    if grid.size == 0:
+        return None, None
+    return grid, meta
+
+def raster_bounds(meta):
+    """[[south, west], [north, east]] of the raster's cell edges, for an ImageOverlay."""
+    half = meta['step_deg'] / 2
+    south, west = meta['south'] - half, meta['west'] - half
+    return [[south, west], [south + meta['n_lat'] * meta['step_deg'], west + meta['n_lon'] * meta['step_deg']]]
+
+def raster_image(grid, opacity=0.6):
+    """
+    RGBA pixels for the raster (row 0 south), coloured from poor to good access up to
+    the 99th percentile; cells with no clinic in reach are transparent.
+    """
+    reached = grid > 0
+    vmax = np.percentile(grid[reached], 99) if reached.any() else 1.0
+    scaled = np.clip(grid / max(vmax, 1e-12), 0, 1)
+
+    ramp = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in RASTER_COLORS], dtype=float)
+    stops = np.linspace(0, 1, len(RASTER_COLORS))
+    rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(scaled, stops, ramp[:, channel]).astype(np.uint8)
+    rgba[..., 3] = np.where(reached, int(255 * opacity), 0)
+    return rgba
+
+def main():
+    parser = argparse.ArgumentParser(description='Two-step floating catchment accessibility scores')
+    parser.add_argument('--catchment_km', type=float, default=20, help='Catchment radius in kilometres')
+    parser.add_argument('--decay', choices=['gaussian', 'uniform'], default='gaussian', help='Distance decay function')
+    parser.add_argument('--raster_step', type=float, default=0.05, help='Raster cell size in degrees')
+    parser.add_argument('--start_date', help='Only count customers assigned on or after this date')
+    parser.add_argument('--end_date', help='Only count customers assigned on or before this date')
+    args = parser.parse_args()
+
+    clinics_df = pd.read_csv('sample_clinics.csv')
+    clinics_df = clinics_df.dropna(subset=['latitude', 'longitude'])
+    customers_df = pd.read_csv('customers_with_latlon_cleaned.csv', low_memory=False)
+    customers_df['assigned_date'] = pd.to_datetime(customers_df['assigned_date'])
+    if args.start_date:
+        customers_df = customers_df[customers_df['assigned_date'] >= pd.Timestamp(args.start_date)]
+    if args.end_date:
+        customers_df = customers_df[customers_df['assigned_date'] < pd.Timestamp(args.end_date) + pd.Timedelta(days=1)]
+    customers_df = customers_df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+
+    # Score unique customer locations, weighted by how many customers share each one
+    codes, unique_lon, unique_lat = factorize_coordinates(customers_df['longitude'], customers_df['latitude'])
+    demand = np.bincount(codes, minlength=len(unique_lon))
+    weights = build_weight_matrix(
+        unique_lat, unique_lon,
+        clinics_df['latitude'].to_numpy(), clinics_df['longitude'].to_numpy(),
+        args.catchment_km, args.decay
+    )
+    supply = clinics_df['weekly_availability_hours'].fillna(0.0).to_numpy(dtype=float)
+    location_score, clinic_ratio = two_step_fca(weights, demand, supply)
+
+    # Per-customer and per-postcode tables
+    columns = [c for c in ['id', 'customer_id', 'postal_code', 'latitude', 'longitude'] if c in customers_df.columns]
+    customer_scores = customers_df[columns].copy()
+    customer_scores['accessibility'] = location_score[codes]
+    customer_scores.to_csv('accessibility_customers.csv', index=False)
+
+    if 'postal_code' in customer_scores.columns:
+        postcode_scores = (customer_scores.groupby('postal_code')
+                           .agg(customers=('accessibility', 'size'), accessibility=('accessibility', 'mean'))
+                           .reset_index()
+                           .sort_values('accessibility'))
+        postcode_scores.to_csv('accessibility_postcodes.csv', index=False)
+
+    # Raster over the customers' extent (empty if there are none)
+    bounds = (unique_lat.min(), unique_lon.min(), unique_lat.max(), unique_lon.max()) if len(unique_lat) else None
+    grid, meta = accessibility_raster(clinics_df, clinic_ratio, bounds, args.raster_step, args.catchment_km, args.decay)
+    np.save(RASTER_FILE, grid)
+    with open(RASTER_META_FILE, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Scored {len(customers_df)} customers at {len(unique_lon)} unique locations "
+          f"against {len(clinics_df)} clinics ({weights.nnz} location-clinic links)")
+    print(f"Customers with no clinic in reach: {(customer_scores['accessibility'] == 0).sum()}")
+    if len(customer_scores):
+        print(f"Median accessibility: {np.median(customer_scores['accessibility']):.4f} hours per customer")
+    print("\nFiles saved:")
+    print("- accessibility_customers.csv: Score for every customer")
+    if 'postal_code' in customer_scores.columns:
+        print("- accessibility_postcodes.csv: Mean score per postcode")
+    print(f"- accessibility_raster.npy: {meta['n_lat']} × {meta['n_lon']} grid (see accessibility_raster.json)")
+
+if __name__ == "__main__":
+    main()
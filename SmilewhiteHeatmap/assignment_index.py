@@ -0,0 +1,272 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+REGIONS_FILE = 'regions.geojson'
+CUSTOMERS_FILE = 'customers_with_latlon_cleaned.csv'
+INDEX_FILE = 'customer_region_index.npz'
+INDEX_META_FILE = 'customer_region_index.json'
+
+def file_fingerprint(path):
+    """Return a fingerprint (path, mtime, size) identifying the current version of a file."""
+    stat = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size
+    }
+
+def prefix_sha1(path, size=None):
+    """SHA-1 of the first size bytes of a file (all of it if size is None)."""
+    digest = hashlib.sha1()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def content_meta(path, n_rows):
+    """Metadata that lets a later version of a file be recognised as a pure append."""
+    return {'customers_sha1': prefix_sha1(path), 'customers_rows': None if n_rows is None else int(n_rows)}
+
+def appended_rows(meta, path):
+    """
+    Number of rows an artifact covers if the file is its source with rows appended
+    and nothing else changed, checked by hashing the old byte prefix; None otherwise.
+    """
+    if meta is None or meta.get('customers_rows') is None or meta.get('customers_sha1') is None:
+        return None
+    if os.path.getsize(path) < meta['customers']['size']:
+        return None
+    if prefix_sha1(path, meta['customers']['size']) != meta['customers_sha1']:
+        return None
+    return meta['customers_rows']
+
+def index_rows_from(index, start):
+    """The part of an index covering rows start onwards, renumbered from 0."""
+    keep = index['point_idx'] >= start
+    return {
+        'point_idx': (index['point_idx'][keep] - start).astype(np.int32),
+        'region_idx': index['region_idx'][keep],
+        'n_points': index['n_points'] - start,
+        'n_regions': index['n_regions']
+    }
+
+def factorize_coordinates(longitudes, latitudes):
+    """
+    Map each point to its unique (longitude, latitude) pair.
+
+    Customers are geocoded by postcode, so many rows share the same coordinates.
+
+    Returns:
+        tuple: (codes, unique_lon, unique_lat) where point i is at
+        (unique_lon[codes[i]], unique_lat[codes[i]])
+    """
+    coords = pd.DataFrame({
+        'lon': np.asarray(longitudes, dtype=float),
+        'lat': np.asarray(latitudes, dtype=float)
+    })
+    codes = coords.groupby(['lon', 'lat'], sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    return codes, coords['lon'].to_numpy()[first_rows], coords['lat'].to_numpy()[first_rows]
+
+def build_region_tree(regions_gdf):
+    """Build an R-tree over the region polygons that can be reused across queries."""
+    return shapely.STRtree(np.asarray(regions_gdf.geometry.values))
+
+def assign_points_to_regions(regions_gdf, longitudes, latitudes, tree=None, verbose=True):
+    """
+    Find the region(s) containing each point.
+
+    Regions produced by generate_regions.py can overlap, so a point may fall in
+    several regions. The result is returned as flat (point, region) pairs so that
+    per-region counts match the polygon-by-polygon path exactly. Only unique
+    coordinates are tested; results are broadcast back to every point.
+
+    Args:
+        regions_gdf (GeoDataFrame): Regions to test against
+        longitudes (array-like): Point longitudes
+        latitudes (array-like): Point latitudes
+        tree (STRtree, optional): Prebuilt tree from build_region_tree
+        verbose (bool): Print how much coordinate de-duplication saved
+
+    Returns:
+        tuple: (point_idx, region_idx) int32 arrays sorted by point. region_idx is the
+        positional index into regions_gdf, or -1 for points not in any region (gaps).
+    """
+    codes, unique_lon, unique_lat = factorize_coordinates(longitudes, latitudes)
+    n_points, n_unique = len(codes), len(unique_lon)
+    if verbose and n_unique:
+        print(f"Assigning {n_points} points via {n_unique} unique coordinates "
+              f"({n_points / n_unique:.1f}x compression)")
+
+    # Bulk query of the unique points against an R-tree of the region polygons
+    points = shapely.points(unique_lon, unique_lat)
+    if tree is None:
+        tree = build_region_tree(regions_gdf)
+    unique_idx, unique_region_idx = tree.query(points, predicate='within')
+    return broadcast_pairs(codes, unique_idx, unique_region_idx, n_unique)
+
+def broadcast_pairs(codes, unique_idx, unique_region_idx, n_unique):
+    """
+    Expand (unique coordinate, region) pairs to (point, region) pairs.
+
+    Unique coordinates with no pair become gaps (-1), and each unique coordinate's
+    regions are repeated for every point sharing it.
+
+    Returns:
+        tuple: (point_idx, region_idx) int32 arrays sorted by point and region
+    """
+    # Unique points with no containing region are gaps
+    gap_idx = np.setdiff1d(np.arange(n_unique), unique_idx)
+    unique_idx = np.concatenate([unique_idx, gap_idx])
+    unique_region_idx = np.concatenate([unique_region_idx, np.full(len(gap_idx), -1)])
+    order = np.lexsort((unique_region_idx, unique_idx))
+    unique_idx, unique_region_idx = unique_idx[order], unique_region_idx[order]
+
+    # Broadcast each unique point's regions back to every point sharing its coordinates
+    pairs_per_unique = np.bincount(unique_idx, minlength=n_unique)
+    first_pair = np.cumsum(pairs_per_unique) - pairs_per_unique
+    pairs_per_point = pairs_per_unique[codes]
+    point_idx = np.repeat(np.arange(len(codes)), pairs_per_point)
+    pair_offset = np.arange(len(point_idx)) - np.repeat(np.cumsum(pairs_per_point) - pairs_per_point, pairs_per_point)
+    region_idx = unique_region_idx[np.repeat(first_pair[codes], pairs_per_point) + pair_offset]
+
+    return point_idx.astype(np.int32), region_idx.astype(np.int32)
+
+def build_assignment_index(regions_gdf, customers_df, tree=None):
+    """Compute the customer→region index for a loaded regions/customers pair."""
+    point_idx, region_idx = assign_points_to_regions(
+        regions_gdf,
+        customers_df['longitude'],
+        customers_df['latitude'],
+        tree=tree
+    )
+    return {
+        'point_idx': point_idx,
+        'region_idx': region_idx,
+        'n_points': len(customers_df),
+        'n_regions': len(regions_gdf)
+    }
+
+def append_to_index(index, new_index):
+    """
+    Extend an index with the index of customer rows appended to the end of the file.
+
+    new_index numbers its points from 0; they are shifted to follow the existing rows.
+    """
+    return {
+        'point_idx': np.concatenate([index['point_idx'], new_index['point_idx'] + index['n_points']]).astype(np.int32),
+        'region_idx': np.concatenate([index['region_idx'], new_index['region_idx']]).astype(np.int32),
+        'n_points': index['n_points'] + new_index['n_points'],
+        'n_regions': index['n_regions']
+    }
+
+def save_assignment_index(index, regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE,
+                          index_path=INDEX_FILE, meta_path=INDEX_META_FILE):
+    """Save the index together with the fingerprints of the files it was built from."""
+    np.savez(index_path, point_idx=index['point_idx'], region_idx=index['region_idx'])
+    meta = {
+        'regions': file_fingerprint(regions_path),
+        'customers': file_fingerprint(customers_path),
+        'n_points': int(index['n_points']),
+        'n_regions': int(index['n_regions'])
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_assignment_index(regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE,
+                          index_path=INDEX_FILE, meta_path=INDEX_META_FILE):
+    """
+    Load a stored index if it is still valid.
+
+    Returns:
+        dict or None: The index, or None if it is missing or was built from a
+        different version of regions.geojson or the customer file.
+    """
+    if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if (meta.get('regions') != file_fingerprint(regions_path) or
+            meta.get('customers') != file_fingerprint(customers_path)):
+        return None
+
+    arrays = np.load(index_path)
+    return {
+        'point_idx': arrays['point_idx'],
+        'region_idx': arrays['region_idx'],
+        'n_points': meta['n_points'],
+        'n_regions': meta['n_regions']
+    }
+
+def get_assignment_index(regions_gdf=None, customers_df=None, regions_path=REGIONS_FILE,
+                         customers_path=CUSTOMERS_FILE, index_path=INDEX_FILE,
+                         meta_path=INDEX_META_FILE, tree=None):
+    """
+    Return a valid customer→region index, rebuilding and saving it if the stored
+    one is missing or stale. Already-loaded data (and a prebuilt region tree) can be
+    passed in to avoid re-reading.
+    """
+    index = load_assignment_index(regions_path, customers_path, index_path, meta_path)
+    if index is not None:
+        return index
+
+    if regions_gdf is None:
+        regions_gdf = gpd.read_file(regions_path)
+    if customers_df is None:
+        customers_df = pd.read_csv(customers_path, usecols=['latitude', 'longitude'])
+
+    index = build_assignment_index(regions_gdf, customers_df, tree)
+    save_assignment_index(index, regions_path, customers_path, index_path, meta_path)
+    return index
+
+def count_by_region(index, row_mask=None):
+    """
+    Count customers per region for the selected customer rows.
+
+    Args:
+        index (dict): Index from get_assignment_index
+        row_mask (np.ndarray, optional): Boolean mask over customer rows. All rows if None.
+
+    Returns:
+        tuple: (counts, gap_rows) where counts[i] is the number of selected customers
+        in region i and gap_rows are the selected customer rows not in any region.
+    """
+    point_idx = index['point_idx']
+    region_idx = index['region_idx']
+    if row_mask is not None:
+        selected = np.asarray(row_mask, dtype=bool)[point_idx]
+        point_idx = point_idx[selected]
+        region_idx = region_idx[selected]
+
+    in_region = region_idx >= 0
+    counts = np.bincount(region_idx[in_region], minlength=index['n_regions'])
+    gap_rows = point_idx[~in_region]
+    return counts, gap_rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the customer to region assignment index')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    parser.add_argument('--customers', default=CUSTOMERS_FILE, help='Cleaned customers CSV file')
+    args = parser.parse_args()
+
+    index = get_assignment_index(regions_path=args.regions, customers_path=args.customers)
+    counts, gap_rows = count_by_region(index)
+
+    print(f"Indexed {index['n_points']} customers against {index['n_regions']} regions")
+    print(f"Customers in at least one region: {index['n_points'] - len(gap_rows)}")
+    print(f"Service gaps: {len(gap_rows)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import time
+import argparse
+import pandas as pd
+import geopandas as gpd
+import folium
+from region_layer import add_region_layer, create_color_scale
+from visualize_regions import create_popup_content
+
+def load_metrics(metrics_path, copies):
+    """Load region metrics, repeating them with small offsets to simulate more regions."""
+    metrics_gdf = gpd.read_file(metrics_path)
+    metrics_gdf['clinic_ids'] = pd.read_csv('regions.csv')['clinic_ids']
+    metrics_gdf['clinic_count'] = metrics_gdf['clinic_ids'].apply(
+        lambda x: len(json.loads(x)) if isinstance(x, str) else 1
+    )
+    metrics_gdf['capacity_ratio'] = metrics_gdf['capacity_ratio'].astype(float)
+
+    shifted = []
+    for copy in range(copies):
+        offset = metrics_gdf.copy()
+        offset['geometry'] = offset.geometry.translate(xoff=0.01 * copy, yoff=0.01 * copy)
+        offset['region_id'] = offset['region_id'] + copy * len(metrics_gdf)
+        shifted.append(offset)
+    return gpd.GeoDataFrame(pd.concat(shifted, ignore_index=True), crs=metrics_gdf.crs)
+
+def add_region_layers_per_row(m, metrics_gdf, color_scale):
+    """The previous renderer: one folium.GeoJson with its own popup and style per region."""
+    for _, row in metrics_gdf.iterrows():
+        popup_content = create_popup_content(row)
+        fill_color = color_scale(row['capacity_ratio']) if row['capacity_ratio'] != float('inf') else 'gray'
+        folium.GeoJson(
+            row.geometry,
+            style_function=lambda x, color=fill_color: {
+                'fillColor': color,
+                'color': 'black',
+                'weight': 1,
+                'fillOpacity': 0.7
+            },
+            popup=folium.Popup(popup_content, max_width=300),
+            tooltip=f"Region {row['region_id']} - {row['status']}"
+        ).add_to(m)
+
+def render(metrics_gdf, add_layers):
+    """Build the map and render its HTML; returns (seconds, bytes)."""
+    start = time.perf_counter()
+    m = folium.Map(location=[54.5, -2], zoom_start=6)
+    color_scale = create_color_scale()
+    color_scale.add_to(m)
+    add_layers(m, metrics_gdf, color_scale)
+    html = m.get_root().render()
+    return time.perf_counter() - start, len(html.encode('utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare region map rendering: one layer per region vs a single layer')
+    parser.add_argument('--metrics', default='region_metrics.geojson', help='Region metrics from process_customers.py')
+    parser.add_argument('--copies', type=int, nargs='+', default=[1, 4], help='Repeat the regions this many times')
+    args = parser.parse_args()
+
+    print(f"{'Regions':>8} {'Renderer':<14} {'Build (s)':>10} {'HTML (MB)':>10}")
+    for copies in args.copies:
+        metrics_gdf = load_metrics(args.metrics, copies)
+        for name, add_layers in [('per-region', add_region_layers_per_row), ('single layer', add_region_layer)]:
+            seconds, size = render(metrics_gdf, add_layers)
+            print(f"{len(metrics_gdf):>8} {name:<14} {seconds:>10.2f} {size / 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    main()
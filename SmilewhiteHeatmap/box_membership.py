@@ -0,0 +1,262 @@
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from assignment_index import assign_points_to_regions, broadcast_pairs, factorize_coordinates
+
+def snap_to(values, targets, tolerance=1e-9):
+    """Replace each value by the nearest of the sorted targets if it is within tolerance."""
+    if len(targets) == 0:
+        return values
+    position = np.clip(np.searchsorted(targets, values), 1, max(len(targets) - 1, 1))
+    nearest = np.where(np.abs(targets[position - 1] - values) <= np.abs(targets[position] - values),
+                       targets[position - 1], targets[position])
+    return np.where(np.abs(nearest - values) <= tolerance, nearest, values)
+
+def load_catchments(boxes_path='clinic_boxes.csv', grids_path='clinic_grids.csv',
+                    grids_geojson_path='clinic_grids.geojson'):
+    """
+    Load clinic catchments as bound arrays.
+
+    Each row of clinic_boxes.csv is one clinic's square. Squares merged into one
+    grid by generate_grids.py share a grid index, and a point covered by any
+    square of a grid is covered by that grid. Grids keep the row order of
+    clinic_grids.csv, which is the order generate_regions.py processes them in.
+
+    generate_regions.py cuts regions from the grids in clinic_grids.geojson, whose
+    coordinates were rounded when written, so the bounds are snapped to those
+    coordinates to put the box edges exactly where the region edges are.
+
+    Returns:
+        dict: minx, miny, maxx, maxy and grid_idx arrays (one entry per box),
+        n_grids, and clinic_to_grid mapping each clinic ID to its grid index
+    """
+    boxes_df = pd.read_csv(boxes_path)
+    grids_df = pd.read_csv(grids_path)
+
+    grid_clinic_ids = [json.loads(ids) for ids in grids_df['all_clinic_ids']]
+    clinic_to_grid = {clinic_id: i for i, ids in enumerate(grid_clinic_ids) for clinic_id in ids}
+
+    grid_coords = shapely.get_coordinates(gpd.read_file(grids_geojson_path).geometry.values)
+    xs, ys = np.unique(grid_coords[:, 0]), np.unique(grid_coords[:, 1])
+
+    return {
+        'minx': snap_to(boxes_df['minx'].to_numpy(dtype=float), xs),
+        'miny': snap_to(boxes_df['miny'].to_numpy(dtype=float), ys),
+        'maxx': snap_to(boxes_df['maxx'].to_numpy(dtype=float), xs),
+        'maxy': snap_to(boxes_df['maxy'].to_numpy(dtype=float), ys),
+        'grid_idx': boxes_df['clinic_id'].map(clinic_to_grid).to_numpy(dtype=np.int64),
+        'n_grids': len(grid_clinic_ids),
+        'clinic_to_grid': clinic_to_grid
+    }
+
+def points_in_boxes(x, y, catchments):
+    """
+    Find every (point, box) pair where the point lies inside the box or on its edges.
+
+    Points are bucketed into columns one box-width wide and sorted by y within
+    each column, so each box only scans the few columns it spans and finds its y
+    range with a binary search.
+
+    Returns:
+        tuple: (point_idx, box_idx) int64 arrays
+    """
+    minx, miny = catchments['minx'], catchments['miny']
+    maxx, maxy = catchments['maxx'], catchments['maxy']
+    if len(x) == 0 or len(minx) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    # Sorted-column index over the points
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    x0 = np.min(x[finite])
+    width = max(np.median(maxx - minx), 1e-9)
+    column = np.where(finite, np.floor((np.where(finite, x, x0) - x0) / width), -1).astype(np.int64)
+    order = np.lexsort((y, column))
+    order = order[column[order] >= 0]
+    sorted_column = column[order]
+    sorted_y = y[order]
+    n_columns = int(sorted_column[-1]) + 1
+    column_start = np.searchsorted(sorted_column, np.arange(n_columns + 1))
+
+    point_parts, box_parts = [], []
+    first_columns = np.floor((minx - x0) / width).astype(np.int64)
+    last_columns = np.floor((maxx - x0) / width).astype(np.int64)
+    for b in range(len(minx)):
+        for c in range(max(first_columns[b], 0), min(last_columns[b], n_columns - 1) + 1):
+            start, end = column_start[c], column_start[c + 1]
+            lo = start + np.searchsorted(sorted_y[start:end], miny[b], side='left')
+            hi = start + np.searchsorted(sorted_y[start:end], maxy[b], side='right')
+            candidates = order[lo:hi]
+            inside = candidates[(x[candidates] >= minx[b]) & (x[candidates] <= maxx[b])]
+            point_parts.append(inside)
+            box_parts.append(np.full(len(inside), b, dtype=np.int64))
+
+    if not point_parts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(point_parts), np.concatenate(box_parts)
+
+def grid_bitsets(rows, grids, n_rows, n_grids):
+    """Pack (row, grid) pairs into one bitset of grids per row, as uint64 words."""
+    bitsets = np.zeros((n_rows, max((n_grids + 63) // 64, 1)), dtype=np.uint64)
+    grids = np.asarray(grids, dtype=np.int64)
+    np.bitwise_or.at(bitsets, (np.asarray(rows, dtype=np.int64), grids // 64),
+                     np.left_shift(np.uint64(1), (grids % 64).astype(np.uint64)))
+    return bitsets
+
+def covering_grids(x, y, catchments):
+    """
+    The grids covering each point, as bitsets.
+
+    Returns:
+        tuple: (inside, touching, first) where inside has the grids with a box
+        strictly containing the point, touching those with a box containing it or
+        its edges, and first is the lowest touching grid index (n_grids if none)
+    """
+    n_grids = catchments['n_grids']
+    point_idx, box_idx = points_in_boxes(x, y, catchments)
+    grid_idx = catchments['grid_idx'][box_idx]
+    px, py = x[point_idx], y[point_idx]
+    strict = ((px > catchments['minx'][box_idx]) & (px < catchments['maxx'][box_idx]) &
+              (py > catchments['miny'][box_idx]) & (py < catchments['maxy'][box_idx]))
+
+    first = np.full(len(x), n_grids, dtype=np.int64)
+    np.minimum.at(first, point_idx, grid_idx)
+    inside = grid_bitsets(point_idx[strict], grid_idx[strict], len(x), n_grids)
+    touching = grid_bitsets(point_idx, grid_idx, len(x), n_grids)
+    return inside, touching, first
+
+def region_grids(regions_df, catchments):
+    """
+    Each region's grids, as generate_regions.py builds them.
+
+    A region is the part of its base grid (the lowest-numbered of its grids) that
+    is inside all of its other grids and outside every earlier grid. A region with
+    a single grid is also outside every later grid, so it is exactly the part of
+    the base grid covered by no other grid.
+
+    Returns:
+        dict: grids (bitsets), base (grid index) and single (one grid only) per region
+    """
+    rows, grids = [], []
+    for row, ids in enumerate(regions_df['clinic_ids']):
+        region_grid_idx = sorted({catchments['clinic_to_grid'][clinic_id] for clinic_id in json.loads(ids)})
+        rows.extend([row] * len(region_grid_idx))
+        grids.extend(region_grid_idx)
+    rows, grids = np.array(rows, dtype=np.int64), np.array(grids, dtype=np.int64)
+
+    base = np.full(len(regions_df), catchments['n_grids'], dtype=np.int64)
+    np.minimum.at(base, rows, grids)
+    return {
+        'grids': grid_bitsets(rows, grids, len(regions_df), catchments['n_grids']),
+        'base': base,
+        'single': np.bincount(rows, minlength=len(regions_df)) == 1
+    }
+
+def assign_points_by_boxes(regions_df, catchments, longitudes, latitudes):
+    """
+    Assign points to regions from the catchment boxes alone, with no polygon geometry.
+
+    A point is within a region when all the region's grids strictly contain it,
+    no grid earlier than the region's base grid touches it and, for single-grid
+    regions, no other grid touches it. Membership therefore depends only on the
+    point's covering grids, so it is worked out once per distinct covering set,
+    against the regions whose base is the first grid touching it, with bitset
+    comparisons.
+
+    Returns:
+        tuple: (point_idx, region_idx) int32 arrays in the same layout as
+        assign_points_to_regions: every (point, region) pair sorted by point, and
+        -1 for gaps
+    """
+    codes, unique_lon, unique_lat = factorize_coordinates(longitudes, latitudes)
+    inside, touching, first = covering_grids(unique_lon, unique_lat, catchments)
+    regions = region_grids(regions_df, catchments)
+
+    # Distinct covering sets, and the set of every unique coordinate
+    _, set_rows, set_of_point = np.unique(np.hstack([inside, touching]), axis=0,
+                                          return_index=True, return_inverse=True)
+    inside, touching, first = inside[set_rows], touching[set_rows], first[set_rows]
+
+    # Candidate regions of each covering set: those whose base is its first touching grid
+    region_order = np.argsort(regions['base'], kind='stable')
+    sorted_base = regions['base'][region_order]
+    lo = np.searchsorted(sorted_base, first, side='left')
+    n_candidates = np.searchsorted(sorted_base, first, side='right') - lo
+    covering_set = np.repeat(np.arange(len(first)), n_candidates)
+    offset = np.arange(len(covering_set)) - np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)
+    region = region_order[np.repeat(lo, n_candidates) + offset]
+
+    region_bits = regions['grids'][region]
+    within = ((region_bits & ~inside[covering_set]) == 0).all(axis=1)
+    single = regions['single'][region]
+    within[single] &= (touching[covering_set[single]] == region_bits[single]).all(axis=1)
+
+    return broadcast_pairs(set_of_point.ravel()[codes], covering_set[within], region[within], len(first))
+
+def compare_with_polygons(box_pairs, polygon_pairs, n_points):
+    """
+    Compare box-engine (point, region) pairs with the polygon path's.
+
+    Both engines return every pair they find, with gaps as region -1, so the pair
+    sets are compared directly.
+
+    Returns:
+        dict: Share of polygon pairs the boxes also find (recall), share of box
+        pairs the polygons confirm (precision), and share of points given exactly
+        the same regions
+    """
+    n_codes = int(max(box_pairs[1].max(initial=-1), polygon_pairs[1].max(initial=-1))) + 2
+    box_codes = box_pairs[0].astype(np.int64) * n_codes + box_pairs[1] + 1
+    polygon_codes = polygon_pairs[0].astype(np.int64) * n_codes + polygon_pairs[1] + 1
+    found = np.isin(polygon_codes, box_codes)
+    confirmed = np.isin(box_codes, polygon_codes)
+
+    # A point matches exactly when both engines give it the same number of pairs, all shared
+    box_per_point = np.bincount(box_pairs[0], minlength=n_points)
+    polygon_per_point = np.bincount(polygon_pairs[0], minlength=n_points)
+    shared_per_point = np.bincount(polygon_pairs[0][found], minlength=n_points)
+    exact = (box_per_point == polygon_per_point) & (shared_per_point == polygon_per_point)
+    return {
+        'pair_recall': found.mean() if len(found) else 1.0,
+        'pair_precision': confirmed.mean() if len(confirmed) else 1.0,
+        'exact_points': exact.mean() if n_points else 1.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark box-algebra region membership against the polygon path')
+    parser.add_argument('--customers', default='customers_with_latlon_cleaned.csv', help='Cleaned customers CSV file')
+    args = parser.parse_args()
+
+    regions_gdf = gpd.read_file('regions.geojson')
+    regions_df = pd.read_csv('regions.csv')
+    catchments = load_catchments()
+    customers_df = pd.read_csv(args.customers, usecols=['latitude', 'longitude'])
+
+    start = time.perf_counter()
+    box_pairs = assign_points_by_boxes(regions_df, catchments, customers_df['longitude'], customers_df['latitude'])
+    box_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    polygon_pairs = assign_points_to_regions(regions_gdf, customers_df['longitude'], customers_df['latitude'])
+    polygon_seconds = time.perf_counter() - start
+
+    comparison = compare_with_polygons(box_pairs, polygon_pairs, len(customers_df))
+
+    print(f"\nCustomers: {len(customers_df)}, catchment boxes: {len(catchments['minx'])}, regions: {len(regions_gdf)}")
+    print(f"Box engine:    {box_seconds:.3f}s, {len(box_pairs[0])} (point, region) pairs")
+    print(f"Polygon path:  {polygon_seconds:.3f}s, {len(polygon_pairs[0])} (point, region) pairs")
+    print(f"Polygon pairs found by the boxes: {comparison['pair_recall']:.1%}")
+    print(f"Box pairs confirmed by the polygons: {comparison['pair_precision']:.1%}")
+    print(f"Points with exactly the same regions: {comparison['exact_points']:.1%}")
+
+    if comparison['pair_recall'] < 1 or comparison['pair_precision'] < 1:
+        raise SystemExit("Box engine membership differs from the polygon path; are clinic_boxes.csv, "
+                         "clinic_grids.csv and regions.csv from the same generate_grids.py/generate_regions.py run?")
+
+if __name__ == "__main__":
+    main()
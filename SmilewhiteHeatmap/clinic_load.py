@@ -0,0 +1,108 @@
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from region_day_counts import get_count_cube, period_bounds, period_counts
+
+def build_incidence_matrix(regions_df, clinics_df):
+    """
+    Build the regions × clinics incidence matrix from regions.csv.
+
+    Each row splits one region's demand across its clinics in proportion to their
+    weekly_availability_hours (equally if none of them have hours), so every
+    non-empty row sums to 1.
+
+    Args:
+        regions_df (pd.DataFrame): regions.csv with JSON clinic_ids lists
+        clinics_df (pd.DataFrame): Clinics with id and weekly_availability_hours
+
+    Returns:
+        tuple: (incidence, clinic_ids) where incidence is a CSR matrix whose
+        columns follow clinic_ids
+    """
+    region_clinics = [json.loads(ids) for ids in regions_df['clinic_ids']]
+    rows = np.repeat(np.arange(len(region_clinics)), [len(ids) for ids in region_clinics])
+    member_ids = np.array([clinic_id for ids in region_clinics for clinic_id in ids], dtype=np.int64)
+
+    clinic_ids, cols = np.unique(member_ids, return_inverse=True)
+    hours = (clinics_df.set_index('id')['weekly_availability_hours']
+             .reindex(clinic_ids).fillna(0.0).to_numpy(dtype=float))
+
+    # Weight by hours, falling back to an equal split for regions without any hours
+    weights = hours[cols]
+    region_hours = np.bincount(rows, weights=weights, minlength=len(region_clinics))
+    region_sizes = np.bincount(rows, minlength=len(region_clinics))
+    weights = np.where(region_hours[rows] > 0,
+                       weights / np.where(region_hours[rows] > 0, region_hours[rows], 1),
+                       1.0 / region_sizes[rows])
+
+    incidence = sp.csr_matrix((weights, (rows, cols)), shape=(len(region_clinics), len(clinic_ids)))
+    return incidence, clinic_ids
+
+def clinic_loads(incidence, region_counts):
+    """
+    Attribute region customer counts to clinics.
+
+    Args:
+        incidence (sparse matrix): Regions × clinics matrix from build_incidence_matrix
+        region_counts (np.ndarray): Counts per region, either a vector or a regions ×
+            windows (or scenarios) matrix
+
+    Returns:
+        np.ndarray: Customer load per clinic, with one column per window if a matrix was given
+    """
+    return incidence.T @ np.asarray(region_counts, dtype=float)
+
+def clinic_load_table(incidence, clinic_ids, clinics_df, cube, window_days=7, step_days=7):
+    """
+    Per-clinic load for every period in the count cube.
+
+    Returns:
+        pd.DataFrame: Long format table with clinic_id, period_start, customer_load,
+        weekly_availability_hours and load_per_hour
+    """
+    starts, covered_starts, ends = period_bounds(cube, window_days, step_days)
+    loads = clinic_loads(incidence, period_counts(cube, covered_starts, ends))
+
+    hours = (clinics_df.set_index('id')['weekly_availability_hours']
+             .reindex(clinic_ids).fillna(0.0).to_numpy(dtype=float))
+    period_hours = hours[:, None] / 7 * (ends - covered_starts)[None, :]
+    load_per_hour = np.divide(loads, period_hours, out=np.full(loads.shape, np.nan), where=period_hours > 0)
+
+    period_start = (np.datetime64(int(cube['first_day']), 'D') + starts).astype('datetime64[ns]')
+    n_clinics, n_periods = loads.shape
+    return pd.DataFrame({
+        'clinic_id': np.repeat(clinic_ids, n_periods),
+        'period_start': np.tile(period_start, n_clinics),
+        'customer_load': loads.ravel(),
+        'weekly_availability_hours': np.repeat(hours, n_periods),
+        'load_per_hour': load_per_hour.ravel()
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description='Attribute region demand to individual clinics')
+    parser.add_argument('--window_days', type=int, default=7, help='Length of each period in days')
+    parser.add_argument('--step_days', type=int, default=7, help='Days between period starts')
+    parser.add_argument('--output', default='clinic_load.csv', help='Output CSV file')
+    args = parser.parse_args()
+
+    regions_df = pd.read_csv('regions.csv')
+    clinics_df = pd.read_csv('sample_clinics.csv')
+    incidence, clinic_ids = build_incidence_matrix(regions_df, clinics_df)
+    cube = get_count_cube()
+
+    load_df = clinic_load_table(incidence, clinic_ids, clinics_df, cube, args.window_days, args.step_days)
+    load_df.to_csv(args.output, index=False)
+
+    print(f"Incidence matrix: {incidence.shape[0]} regions × {incidence.shape[1]} clinics ({incidence.nnz} links)")
+    print(f"Saved {args.output} with {load_df['period_start'].nunique()} periods")
+
+    # Print the busiest clinics over the whole period
+    totals = load_df.groupby('clinic_id')['customer_load'].sum().sort_values(ascending=False)
+    print("\nHighest total load:")
+    for clinic_id, load in totals.head(5).items():
+        print(f"Clinic {clinic_id}: {load:.1f} customers")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from assignment_index import (REGIONS_FILE, CUSTOMERS_FILE, appended_rows, content_meta, file_fingerprint,
+                              get_assignment_index, index_rows_from)
+from region_day_counts import day_ordinals, date_to_ordinal, ordinal_to_date
+
+SKETCH_FILE = 'region_day_hll.npy'
+SKETCH_META_FILE = 'region_day_hll.json'
+DEFAULT_ERROR = 0.05
+MAX_PRECISION = 10  # sketches are dense per region and day: 2^10 registers is ~160 MB for 432 regions over a year
+ID_HASH_VERSION = 2  # stored with the sketches; sketches hashed another way are rebuilt rather than extended
+
+def precision_for_error(error):
+    """
+    Smallest HyperLogLog precision whose standard error (1.04 / sqrt(2^p)) is within
+    the given relative error, clamped to 4-MAX_PRECISION (about 3.3% at best).
+    """
+    p = int(np.ceil(np.log2((1.04 / error) ** 2)))
+    return min(max(p, 4), MAX_PRECISION)
+
+def normalize_customer_ids(customer_ids):
+    """
+    Customer IDs as strings that do not depend on how the column was parsed.
+
+    Numeric IDs are written as integers when they are whole numbers, so 12, 12.0 (an
+    integer column read as float because of a missing value) and "12" all become "12".
+    Text IDs are kept verbatim, so "012" stays distinct from 12.
+    """
+    ids = pd.Series(customer_ids).reset_index(drop=True)
+    if pd.api.types.is_integer_dtype(ids) and not ids.hasnans:
+        return ids.astype(np.int64).astype(str).astype(object)
+    numeric = pd.api.types.is_numeric_dtype(ids)
+    ids = ids.astype(object)
+    text = ids.map(str)
+    if pd.api.types.infer_dtype(ids, skipna=True) in ('string', 'empty'):
+        return text
+    is_text = np.zeros(len(ids), dtype=bool) if numeric else ids.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    numbers = pd.to_numeric(ids.where(~is_text), errors='coerce').astype(float)
+    whole = (numbers.notna() & (numbers % 1 == 0) & (numbers.abs() < 2.0 ** 63)).to_numpy()
+    text[whole] = numbers[whole].astype(np.int64).astype(str)
+    return text
+
+def hash_customer_ids(customer_ids):
+    """64-bit hashes of normalized customer IDs, so CSV, Parquet and appended batches agree."""
+    return pd.util.hash_array(normalize_customer_ids(customer_ids).to_numpy(dtype=object))
+
+def register_ranks(hashes, precision):
+    """
+    Split hashes into a register index (top precision bits) and a rank (position of
+    the first set bit in the remaining bits, counting from 1).
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n_bits = 64 - precision
+    registers = (hashes >> np.uint64(n_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << n_bits) - 1)
+
+    # Exact bit length of the remaining bits by binary search over shifts
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = rest >= np.uint64(1 << shift)
+        bit_length += np.where(high, shift, 0)
+        rest = np.where(high, rest >> np.uint64(shift), rest)
+    bit_length += (rest > 0)
+
+    ranks = (n_bits - bit_length + 1).astype(np.uint8)
+    return registers, ranks
+
+def sketch_pairs_by_day(index, days, hashes, first_day, n_days, precision, rows=None):
+    """
+    HyperLogLog registers per (region, day) for customer rows in [first_day, first_day + n_days).
+
+    Returns:
+        np.ndarray: uint8 registers of shape (n_regions + 1, n_days, 2^precision). The
+        last row holds gaps.
+    """
+    n_regions = index['n_regions']
+    n_registers = 1 << precision
+    point_idx = index['point_idx']
+    region_idx = index['region_idx']
+    if rows is not None:
+        selected = np.zeros(len(days), dtype=bool)
+        selected[rows] = True
+        keep = selected[point_idx]
+        point_idx = point_idx[keep]
+        region_idx = region_idx[keep]
+
+    day_offset = days[point_idx] - first_day
+    valid = (day_offset >= 0) & (day_offset < n_days)
+    point_idx, region_idx, day_offset = point_idx[valid], region_idx[valid], day_offset[valid]
+    sketch_row = np.where(region_idx >= 0, region_idx, n_regions).astype(np.int64)
+
+    register, rank = register_ranks(hashes[point_idx], precision)
+    cells = (sketch_row * n_days + day_offset) * n_registers + register
+
+    registers = np.zeros((n_regions + 1) * n_days * n_registers, dtype=np.uint8)
+    np.maximum.at(registers, cells, rank)
+    return registers.reshape(n_regions + 1, n_days, n_registers)
+
+def build_distinct_sketch(index, days, hashes, error=DEFAULT_ERROR):
+    """
+    Build mergeable distinct-customer sketches for every region and day.
+
+    Args:
+        index (dict): Customer to region index from assignment_index.py
+        days (np.ndarray): Day ordinal of every customer row
+        hashes (np.ndarray): Customer ID hash of every customer row
+        error (float): Target relative standard error of the estimates
+
+    Returns:
+        dict: 'registers' (n_regions + 1, n_days, 2^precision) uint8 array, 'first_day',
+        'n_regions', 'precision' and 'n_rows' (customer rows sketched)
+    """
+    precision = precision_for_error(error)
+    valid_days = days[days >= 0]
+    first_day = int(valid_days.min()) if len(valid_days) else 0
+    n_days = int(valid_days.max()) - first_day + 1 if len(valid_days) else 0
+
+    registers = sketch_pairs_by_day(index, days, hashes, first_day, n_days, precision)
+    return {'registers': registers, 'first_day': first_day, 'n_regions': index['n_regions'],
+            'precision': precision, 'n_rows': len(days)}
+
+def add_to_distinct_sketch(sketch, index, days, hashes):
+    """
+    Merge newly appended customer rows into existing sketches.
+
+    Args:
+        sketch (dict): Existing sketches
+        index (dict): Assignment index of the new rows only
+        days, hashes (np.ndarray): Day ordinal and customer ID hash of each new row
+
+    Returns:
+        dict: The sketches, widened if the new rows fall outside their days
+    """
+    registers = np.asarray(sketch['registers'])
+    n_days = registers.shape[1]
+    n_rows = None if sketch.get('n_rows') is None else sketch['n_rows'] + len(days)
+    valid_days = days[days >= 0]
+    if not len(valid_days):
+        return {**sketch, 'n_rows': n_rows}
+
+    new_first, new_last = int(valid_days.min()), int(valid_days.max())
+    old_first = sketch['first_day'] if n_days else new_first
+    first_day = min(old_first, new_first)
+    last_day = max(old_first + n_days - 1, new_last)
+
+    extended = np.zeros((registers.shape[0], last_day - first_day + 1, registers.shape[2]), dtype=np.uint8)
+    extended[:, old_first - first_day:old_first - first_day + n_days] = registers
+
+    # Only the days the new rows touch are sketched and merged
+    new_registers = sketch_pairs_by_day(index, days, hashes, new_first, new_last - new_first + 1,
+                                        sketch['precision'])
+    window = slice(new_first - first_day, new_last - first_day + 1)
+    extended[:, window] = np.maximum(extended[:, window], new_registers)
+    return {'registers': extended, 'first_day': first_day, 'n_regions': sketch['n_regions'],
+            'precision': sketch['precision'], 'n_rows': n_rows}
+
+def estimate_cardinality(registers):
+    """
+    HyperLogLog estimate along the last axis, with linear counting for small ranges.
+
+    A 64-bit hash makes the large-range correction unnecessary.
+    """
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=-1)
+
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+def window_distinct_counts(sketch, start_date, end_date):
+    """
+    Approximate distinct customers for an inclusive date window.
+
+    Day sketches are merged by taking the register-wise maximum, so the estimate
+    counts each customer once per region however many days they appear on.
+
+    Returns:
+        tuple: (region_counts, gap_count) rounded to whole customers
+    """
+    registers = sketch['registers']
+    n_days = registers.shape[1]
+    start = min(max(date_to_ordinal(start_date) - sketch['first_day'], 0), n_days)
+    end = min(max(date_to_ordinal(end_date) - sketch['first_day'] + 1, start), n_days)
+    if start == end:
+        return np.zeros(sketch['n_regions'], dtype=np.int64), 0
+
+    merged = registers[:, start:end].max(axis=1)
+    counts = np.rint(estimate_cardinality(merged)).astype(np.int64)
+    return counts[:-1], int(counts[-1])
+
+def sketch_paths(regions_path=REGIONS_FILE):
+    """Return the sketch and metadata paths stored next to the regions artifact."""
+    base_dir = os.path.dirname(os.path.abspath(regions_path))
+    return os.path.join(base_dir, SKETCH_FILE), os.path.join(base_dir, SKETCH_META_FILE)
+
+def save_distinct_sketch(sketch, regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """Save the sketches as a memory-mappable .npy file with a JSON metadata sidecar."""
+    sketch_path, meta_path = sketch_paths(regions_path)
+
+    tmp_path = sketch_path + '.tmp.npy'
+    np.save(tmp_path, sketch['registers'])
+    os.replace(tmp_path, sketch_path)
+    meta = {
+        'regions': file_fingerprint(regions_path),
+        'customers': file_fingerprint(customers_path),
+        'first_day': int(sketch['first_day']),
+        'n_regions': int(sketch['n_regions']),
+        'precision': int(sketch['precision']),
+        'id_hash': ID_HASH_VERSION,
+        **content_meta(customers_path, sketch.get('n_rows'))
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_distinct_sketch(regions_path=REGIONS_FILE, mmap_mode='r'):
+    """
+    Load stored sketches, memory-mapped by default.
+
+    Returns:
+        tuple: (sketch, meta) or (None, None) if no sketch has been saved.
+    """
+    sketch_path, meta_path = sketch_paths(regions_path)
+    if not (os.path.exists(sketch_path) and os.path.exists(meta_path)):
+        return None, None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    sketch = {
+        'registers': np.load(sketch_path, mmap_mode=mmap_mode),
+        'first_day': meta['first_day'],
+        'n_regions': meta['n_regions'],
+        'precision': meta['precision'],
+        'n_rows': meta.get('customers_rows')
+    }
+    return sketch, meta
+
+def get_distinct_sketch(regions_gdf=None, customers_df=None, index=None, error=DEFAULT_ERROR,
+                        regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """
+    Return up-to-date distinct-customer sketches for the given error bound.
+
+    Follows get_count_cube: stored sketches are reused if nothing changed, have the
+    new rows merged in if the customer file was only appended to, and are rebuilt
+    otherwise or when the precision differs.
+    """
+    sketch, meta = load_distinct_sketch(regions_path)
+    customers_version = file_fingerprint(customers_path)
+    regions_version = file_fingerprint(regions_path)
+    same_precision = (meta is not None and meta['precision'] == precision_for_error(error)
+                      and meta.get('id_hash') == ID_HASH_VERSION)
+    if same_precision and meta['regions'] == regions_version and meta['customers'] == customers_version:
+        return sketch
+
+    if customers_df is None:
+        customers_df = pd.read_csv(customers_path, usecols=['customer_id', 'assigned_date', 'latitude', 'longitude'])
+    if index is None:
+        index = get_assignment_index(regions_gdf, customers_df, regions_path, customers_path)
+
+    # Rows without a customer ID cannot be told apart, so they are left out
+    days = day_ordinals(customers_df['assigned_date'])
+    days = np.where(customers_df['customer_id'].isna().to_numpy(), -1, days)
+    hashes = hash_customer_ids(customers_df['customer_id'])
+
+    n_old = appended_rows(meta, customers_path) if same_precision and meta['regions'] == regions_version else None
+    if n_old is not None and n_old <= len(days):
+        sketch = add_to_distinct_sketch(sketch, index_rows_from(index, n_old), days[n_old:], hashes[n_old:])
+    else:
+        sketch = build_distinct_sketch(index, days, hashes, error)
+
+    save_distinct_sketch(sketch, regions_path, customers_path)
+    return sketch
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute distinct-customer HyperLogLog sketches per region and day')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    parser.add_argument('--customers', default=CUSTOMERS_FILE, help='Cleaned customers CSV file')
+    parser.add_argument('--error', type=float, default=DEFAULT_ERROR, help='Target relative error of the distinct counts (at best about 3.3%%)')
+    args = parser.parse_args()
+
+    sketch = get_distinct_sketch(error=args.error, regions_path=args.regions, customers_path=args.customers)
+    n_regions, n_days, n_registers = sketch['registers'].shape
+
+    print(f"Distinct-customer sketches: {n_regions - 1} regions × {n_days} days × {n_registers} registers "
+          f"(~{1.04 / np.sqrt(n_registers):.1%} standard error)")
+    if n_days:
+        start = ordinal_to_date(sketch['first_day'])
+        end = ordinal_to_date(sketch['first_day'] + n_days - 1)
+        region_counts, gap_count = window_distinct_counts(sketch, start, end)
+        print(f"Days: {start} to {end}")
+        print(f"Distinct customers per region over the whole period: {region_counts.sum()} in total")
+        print(f"Distinct customers in service gaps: {gap_count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.cluster import DBSCAN, HDBSCAN
+from assignment_index import factorize_coordinates
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between points given in degrees."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def cluster_gap_hotspots(gaps_df, eps_km=5.0, min_customers=20, method='dbscan', top_n_postcodes=3):
+    """
+    Cluster service gaps into hotspots.
+
+    Clustering runs on unique gap coordinates with a haversine BallTree. With
+    DBSCAN each location is weighted by the number of gaps sharing it, so
+    min_customers counts customers rather than locations. HDBSCAN does not
+    take weights, so there min_customers is the minimum number of distinct
+    locations and multiplicity only affects the hotspot summaries.
+
+    Args:
+        gaps_df (pd.DataFrame): Gap records with latitude, longitude and optionally postal_code
+        eps_km (float): DBSCAN neighbourhood radius in kilometres
+        min_customers (int): Minimum cluster size
+        method (str): 'dbscan' or 'hdbscan'
+        top_n_postcodes (int): Number of postcodes to list per hotspot
+
+    Returns:
+        pd.DataFrame: One row per hotspot with hotspot_id, latitude, longitude,
+        customer_count, radius_km and top_postcodes, largest first
+    """
+    columns = ['hotspot_id', 'latitude', 'longitude', 'customer_count', 'radius_km', 'top_postcodes']
+    gaps_df = gaps_df.dropna(subset=['latitude', 'longitude'])
+    if gaps_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    codes, unique_lon, unique_lat = factorize_coordinates(gaps_df['longitude'], gaps_df['latitude'])
+    multiplicity = np.bincount(codes, minlength=len(unique_lon))
+    coords = np.radians(np.column_stack([unique_lat, unique_lon]))
+
+    if method == 'hdbscan':
+        clusterer = HDBSCAN(min_cluster_size=max(min_customers, 2), metric='haversine', algorithm='ball_tree', copy=True)
+        location_labels = clusterer.fit_predict(coords)
+    else:
+        clusterer = DBSCAN(eps=eps_km / EARTH_RADIUS_KM, min_samples=min_customers,
+                           metric='haversine', algorithm='ball_tree')
+        location_labels = clusterer.fit_predict(coords, sample_weight=multiplicity)
+
+    clustered = location_labels >= 0
+    if not clustered.any():
+        return pd.DataFrame(columns=columns)
+
+    # Weighted centroid and size of each cluster
+    labels = location_labels[clustered]
+    weights = multiplicity[clustered]
+    n_clusters = labels.max() + 1
+    customer_count = np.bincount(labels, weights=weights, minlength=n_clusters)
+    centroid_lat = np.bincount(labels, weights=weights * unique_lat[clustered], minlength=n_clusters) / customer_count
+    centroid_lon = np.bincount(labels, weights=weights * unique_lon[clustered], minlength=n_clusters) / customer_count
+
+    # Radius: furthest member location from the centroid
+    distances = haversine_km(unique_lat[clustered], unique_lon[clustered], centroid_lat[labels], centroid_lon[labels])
+    radius_km = np.zeros(n_clusters)
+    np.maximum.at(radius_km, labels, distances)
+
+    hotspots_df = pd.DataFrame({
+        'hotspot_id': np.arange(n_clusters),
+        'latitude': centroid_lat,
+        'longitude': centroid_lon,
+        'customer_count': customer_count.astype(int),
+        'radius_km': radius_km,
+        'top_postcodes': ''
+    })
+
+    if 'postal_code' in gaps_df.columns:
+        row_labels = location_labels[codes]
+        postcode_counts = (pd.DataFrame({'hotspot_id': row_labels, 'postal_code': gaps_df['postal_code'].to_numpy()})
+                           .query('hotspot_id >= 0')
+                           .groupby(['hotspot_id', 'postal_code'])
+                           .size()
+                           .rename('count')
+                           .reset_index()
+                           .sort_values(['hotspot_id', 'count'], ascending=[True, False]))
+        top = postcode_counts.groupby('hotspot_id').head(top_n_postcodes)
+        top = ((top['postal_code'].astype(str) + ' (' + top['count'].astype(str) + ')')
+               .groupby(top['hotspot_id'], sort=False)
+               .agg(', '.join))
+        hotspots_df['top_postcodes'] = hotspots_df['hotspot_id'].map(top).fillna('')
+
+    return hotspots_df.sort_values('customer_count', ascending=False).reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster service gaps into hotspots')
+    parser.add_argument('--gaps', default='service_gaps.csv', help='Service gaps CSV from process_customers.py')
+    parser.add_argument('--eps_km', type=float, default=5.0, help='Neighbourhood radius in kilometres (DBSCAN)')
+    parser.add_argument('--min_customers', type=int, default=20, help='Minimum hotspot size')
+    parser.add_argument('--method', choices=['dbscan', 'hdbscan'], default='dbscan', help='Clustering algorithm')
+    args = parser.parse_args()
+
+    gaps_df = pd.read_csv(args.gaps)
+    hotspots_df = cluster_gap_hotspots(gaps_df, args.eps_km, args.min_customers, args.method)
+    hotspots_df.to_csv('gap_hotspots.csv', index=False)
+
+    print(f"Found {len(hotspots_df)} hotspots covering {hotspots_df['customer_count'].sum()} of {len(gaps_df)} service gaps")
+    for _, hotspot in hotspots_df.head(10).iterrows():
+        print(f"({hotspot['latitude']:.3f}, {hotspot['longitude']:.3f}): {hotspot['customer_count']} customers "
+              f"within {hotspot['radius_km']:.1f} km - {hotspot['top_postcodes']}")
+
+if __name__ == "__main__":
+    main()
@@ -125,6 +125,13 @@ def main():
     
     print(f"Created {len(grids)} initial grids")
     
+    # Save each clinic's axis-aligned box so membership can be tested without polygons
+    boxes_df = pd.DataFrame(
+        [(grid['clinic_id'],) + grid['geometry'].bounds for grid in grids],
+        columns=['clinic_id', 'minx', 'miny', 'maxx', 'maxy']
+    )
+    boxes_df.to_csv('clinic_boxes.csv', index=False)
+    
     # Merge nearby grids if merge_distance > 0
     merged_grids = merge_nearby_squares(grids, args.merge_distance)
     print(f"Merged into {len(merged_grids)} grids")
@@ -164,6 +171,7 @@ def main():
     print("\nFiles saved:")
     print("- clinic_grids.geojson: Contains the grid geometries")
     print("- clinic_grids.csv: Contains the clinic data with merged IDs")
+    print("- clinic_boxes.csv: Contains the bounds of each clinic's grid square")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
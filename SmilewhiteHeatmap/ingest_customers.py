@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from assignment_index import (REGIONS_FILE, CUSTOMERS_FILE, append_to_index, build_assignment_index,
+                              file_fingerprint, load_assignment_index, save_assignment_index)
+from region_day_counts import add_to_count_cube, day_ordinals, load_count_cube, save_count_cube
+from distinct_counts import (ID_HASH_VERSION, add_to_distinct_sketch, hash_customer_ids, load_distinct_sketch,
+                             save_distinct_sketch)
+from postcode_rollups import add_to_postcode_rollup, build_postcode_rollup, load_postcode_rollup, save_postcode_rollup
+
+# Geocoding and cleaning live with the original data preparation scripts in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DataProcessing import geocode_rows
+from Customerdataclean import clean_customer_frame
+
+WATERMARK_FILE = 'ingest_watermark.json'
+
+def latest_record(df):
+    """Return the (assigned_date, id) of the latest record in df."""
+    dates = pd.to_datetime(df['assigned_date'])
+    latest = np.lexsort((df['id'].to_numpy(), dates.to_numpy()))[-1]
+    return dates.iloc[latest], int(df['id'].iloc[latest])
+
+def read_watermark(watermark_path=WATERMARK_FILE, customers_path=CUSTOMERS_FILE):
+    """
+    Return the (assigned_date, id) high-water mark of the ingested history.
+
+    Without a stored watermark it is taken from the existing customer file, or is
+    None if there is no history yet.
+    """
+    if os.path.exists(watermark_path):
+        with open(watermark_path) as f:
+            watermark = json.load(f)
+        return pd.Timestamp(watermark['assigned_date']), watermark['id']
+    if os.path.exists(customers_path):
+        history = pd.read_csv(customers_path, usecols=['id', 'assigned_date'])
+        history = history.dropna(subset=['assigned_date'])
+        if len(history):
+            return latest_record(history)
+    return None
+
+def write_watermark(watermark, watermark_path=WATERMARK_FILE):
+    """Store the high-water mark."""
+    assigned_date, record_id = watermark
+    with open(watermark_path, 'w') as f:
+        json.dump({'assigned_date': assigned_date.isoformat(), 'id': int(record_id)}, f, indent=2)
+
+def select_new_rows(raw_df, watermark):
+    """
+    Rows after the watermark in (assigned_date, id) order.
+
+    Rows without an assigned_date cannot be placed against the watermark and are skipped.
+    """
+    dates = pd.to_datetime(raw_df['assigned_date'])
+    new = dates.notna()
+    if watermark is not None:
+        watermark_date, watermark_id = watermark
+        new &= (dates > watermark_date) | ((dates == watermark_date) & (raw_df['id'] > watermark_id))
+    raw_df, dates = raw_df[new], dates[new]
+
+    order = np.lexsort((raw_df['id'].to_numpy(), dates.to_numpy()))
+    return raw_df.iloc[order].reset_index(drop=True)
+
+def geocode_new_rows(new_df):
+    """Geocode the rows that arrive without coordinates."""
+    if 'latitude' not in new_df.columns or 'longitude' not in new_df.columns:
+        new_df = new_df.assign(latitude=np.nan, longitude=np.nan)
+
+    missing = (new_df['latitude'].isna() | new_df['longitude'].isna()).to_numpy()
+    if missing.any():
+        geocoded = pd.DataFrame(geocode_rows(new_df[missing].to_dict('records')))
+        new_df.loc[missing, 'latitude'] = pd.to_numeric(geocoded['latitude']).to_numpy()
+        new_df.loc[missing, 'longitude'] = pd.to_numeric(geocoded['longitude']).to_numpy()
+    return new_df
+
+def ingest_customers(raw_path, customers_path=CUSTOMERS_FILE, regions_path=REGIONS_FILE,
+                     watermark_path=WATERMARK_FILE):
+    """
+    Append customers newer than the watermark and update the stored artifacts in place.
+
+    Only the new rows are geocoded, cleaned and assigned to regions. The assignment
+    index, count cube, distinct-customer sketches and postcode roll-up are extended
+    with them if they were current before the append; any that were already stale
+    are left to be rebuilt the next time they are requested.
+
+    Returns:
+        dict: Rows read, new rows, rows appended, the new watermark and the
+        artifacts that were updated
+    """
+    watermark = read_watermark(watermark_path, customers_path)
+    raw_df = pd.read_csv(raw_path, low_memory=False)
+    new_df = select_new_rows(raw_df, watermark)
+    summary = {'read': len(raw_df), 'new': len(new_df), 'appended': 0, 'watermark': watermark, 'updated': []}
+    if new_df.empty:
+        return summary
+    summary['watermark'] = latest_record(new_df)
+
+    new_df = clean_customer_frame(geocode_new_rows(new_df)).reset_index(drop=True)
+    summary['appended'] = len(new_df)
+
+    # Load the artifacts that are current before the customer file changes
+    has_history = os.path.exists(customers_path)
+    regions_version = file_fingerprint(regions_path)
+    customers_version = file_fingerprint(customers_path) if has_history else None
+
+    def is_current(meta):
+        return meta is not None and meta['regions'] == regions_version and meta['customers'] == customers_version
+
+    index = load_assignment_index(regions_path, customers_path) if has_history else None
+    cube, cube_meta = load_count_cube(regions_path)
+    sketch, sketch_meta = load_distinct_sketch(regions_path)
+    rollup, rollup_meta = load_postcode_rollup(customers_path)
+
+    # Assign only the new rows
+    new_index = build_assignment_index(gpd.read_file(regions_path), new_df)
+
+    # Append in the existing column order, then move the watermark past this batch
+    if has_history:
+        columns = pd.read_csv(customers_path, nrows=0).columns
+        new_df.reindex(columns=columns).to_csv(customers_path, mode='a', header=False, index=False)
+    else:
+        new_df.to_csv(customers_path, index=False)
+    write_watermark(summary['watermark'], watermark_path)
+
+    days = day_ordinals(new_df['assigned_date'])
+    if index is not None:
+        save_assignment_index(append_to_index(index, new_index), regions_path, customers_path)
+        summary['updated'].append('assignment index')
+    if is_current(cube_meta):
+        save_count_cube(add_to_count_cube(cube, new_index, days), regions_path, customers_path)
+        summary['updated'].append('count cube')
+    if is_current(sketch_meta) and sketch_meta.get('id_hash') == ID_HASH_VERSION:
+        sketch_days = np.where(new_df['customer_id'].isna().to_numpy(), -1, days)
+        hashes = hash_customer_ids(new_df['customer_id'])
+        save_distinct_sketch(add_to_distinct_sketch(sketch, new_index, sketch_days, hashes), regions_path, customers_path)
+        summary['updated'].append('distinct-customer sketches')
+    if is_current(rollup_meta):
+        new_rollup = build_postcode_rollup(new_df, new_index)
+        n_rows = None if rollup_meta.get('customers_rows') is None else rollup_meta['customers_rows'] + len(new_df)
+        save_postcode_rollup(add_to_postcode_rollup(rollup, new_rollup), regions_path, customers_path, n_rows)
+        summary['updated'].append('postcode roll-up')
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new customers and update the stored aggregates in place')
+    parser.add_argument('new_customers', help='CSV export of customers (with postal_code; coordinates are geocoded if missing)')
+    parser.add_argument('--customers', default=CUSTOMERS_FILE, help='Cleaned customer history to append to')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    parser.add_argument('--watermark', default=WATERMARK_FILE, help='High-water mark file')
+    args = parser.parse_args()
+
+    summary = ingest_customers(args.new_customers, args.customers, args.regions, args.watermark)
+
+    print(f"Read {summary['read']} rows, {summary['new']} newer than the watermark")
+    print(f"Appended {summary['appended']} cleaned customers to {args.customers}")
+    if summary['watermark'] is not None:
+        assigned_date, record_id = summary['watermark']
+        print(f"Watermark: {assigned_date} (id {record_id})")
+    if summary['updated']:
+        print(f"Updated in place: {', '.join(summary['updated'])}")
+
+if __name__ == "__main__":
+    main()
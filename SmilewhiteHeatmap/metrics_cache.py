@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import shapely
+from geopandas.array import GeometryDtype
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def create_cache(max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Create a thread-safe LRU cache bounded by the memory of its entries.
+
+    Returns:
+        dict: Cache state for cache_get, cache_put and cached_call
+    """
+    return {
+        'entries': OrderedDict(),
+        'lock': threading.Lock(),
+        'max_bytes': max_bytes,
+        'bytes': 0,
+        'hits': 0,
+        'misses': 0,
+        'evictions': 0
+    }
+
+def frames_nbytes(*frames):
+    """
+    Memory used by DataFrames, including the contents of object columns and the
+    coordinates of geometry columns (measured by their WKB size, since pandas only
+    counts the pointers).
+    """
+    total = 0
+    for frame in frames:
+        total += int(frame.memory_usage(deep=True).sum())
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, GeometryDtype):
+                wkb = shapely.to_wkb(np.asarray(frame[column].values))
+                total += sum(len(value) for value in wkb if value is not None)
+    return total
+
+def cache_get(cache, key):
+    """Return the cached value for key (marking it most recently used), or None."""
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is None:
+            cache['misses'] += 1
+            return None
+        cache['entries'].move_to_end(key)
+        cache['hits'] += 1
+        return entry[0]
+
+def cache_put(cache, key, value, nbytes):
+    """
+    Store a value, evicting least recently used entries until the cache fits its
+    memory budget again. The newest entry is always kept.
+    """
+    with cache['lock']:
+        entries = cache['entries']
+        if key in entries:
+            cache['bytes'] -= entries.pop(key)[1]
+        entries[key] = (value, nbytes)
+        cache['bytes'] += nbytes
+
+        while cache['bytes'] > cache['max_bytes'] and len(entries) > 1:
+            _, (_, evicted_bytes) = entries.popitem(last=False)
+            cache['bytes'] -= evicted_bytes
+            cache['evictions'] += 1
+
+def cached_call(cache, key, compute, sizeof):
+    """
+    Return the cached value for key, computing and storing it on a miss.
+
+    compute runs outside the lock, so a slow miss does not block other sessions' hits.
+    """
+    value = cache_get(cache, key)
+    if value is None:
+        value = compute()
+        cache_put(cache, key, value, sizeof(value))
+    return value
+
+def cache_stats(cache):
+    """Snapshot of the hit, miss and eviction counters and current size."""
+    with cache['lock']:
+        return {
+            'hits': cache['hits'],
+            'misses': cache['misses'],
+            'evictions': cache['evictions'],
+            'entries': len(cache['entries']),
+            'bytes': cache['bytes'],
+            'max_bytes': cache['max_bytes']
+        }
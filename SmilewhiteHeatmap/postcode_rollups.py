@@ -0,0 +1,227 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from assignment_index import (REGIONS_FILE, CUSTOMERS_FILE, appended_rows, content_meta, file_fingerprint,
+                              get_assignment_index, index_rows_from)
+from region_day_counts import day_ordinals, date_to_ordinal
+
+ROLLUP_FILE = 'postcode_day_counts.parquet'
+ROLLUP_META_FILE = 'postcode_day_counts.json'
+LEVELS = ['area', 'district', 'sector']
+UNKNOWN = 'Unknown'
+
+# Outward code (area letters + district) followed by the inward code (sector digit + unit letters)
+POSTCODE_PATTERN = r'^(?P<area>[A-Z]{1,2})(?P<district>\d[A-Z\d]?)(?P<sector>\d)[A-Z]{2}$'
+
+def postcode_hierarchy(postal_codes):
+    """
+    Split postcodes into area ("SW"), district ("SW1A") and sector ("SW1A 1").
+
+    Postcodes that do not parse are grouped under 'Unknown' at every level.
+
+    Returns:
+        pd.DataFrame: area, district and sector columns aligned with the input
+    """
+    compact = pd.Series(np.asarray(postal_codes, dtype=object)).astype('string')
+    compact = compact.str.upper().str.replace(r'\s+', '', regex=True)
+    parts = compact.str.extract(POSTCODE_PATTERN)
+    district = parts['area'] + parts['district']
+    return pd.DataFrame({
+        'area': parts['area'].fillna(UNKNOWN),
+        'district': district.fillna(UNKNOWN),
+        'sector': (district + ' ' + parts['sector']).fillna(UNKNOWN)
+    })
+
+def build_postcode_rollup(customers_df, index=None):
+    """
+    Count customers (and service gaps, if an assignment index is given) per postcode
+    sector and day, and roll the sector counts up to districts and areas.
+
+    Customers are grouped once by (area, district, sector, day); the coarser levels
+    are sums over that table rather than further passes over the customers. Without a
+    postal_code column every customer is counted under 'Unknown'.
+
+    Returns:
+        pd.DataFrame: Long table with level, key, parent, day (ordinal), customer_count
+        and gap_count, sorted by level, key and day
+    """
+    if 'postal_code' in customers_df.columns:
+        postal_codes = customers_df['postal_code']
+    else:
+        postal_codes = pd.Series(np.full(len(customers_df), None, dtype=object))
+    hierarchy = postcode_hierarchy(postal_codes)
+    hierarchy['day'] = day_ordinals(customers_df['assigned_date'])
+    hierarchy['customer_count'] = 1
+    gap_count = np.zeros(len(hierarchy), dtype=np.int64)
+    if index is not None:
+        gap_count[index['point_idx'][index['region_idx'] < 0]] = 1
+    hierarchy['gap_count'] = gap_count
+    hierarchy = hierarchy[hierarchy['day'] >= 0]
+
+    sector_counts = (hierarchy.groupby(['area', 'district', 'sector', 'day'], sort=False)
+                     [['customer_count', 'gap_count']].sum()
+                     .reset_index())
+
+    tables = []
+    for level, parent in zip(LEVELS, [None] + LEVELS[:-1]):
+        level_counts = (sector_counts.groupby(([parent] if parent else []) + [level, 'day'], sort=False)
+                        [['customer_count', 'gap_count']].sum()
+                        .reset_index()
+                        .rename(columns={level: 'key', parent: 'parent'}))
+        if parent is None:
+            level_counts['parent'] = ''
+        level_counts['level'] = level
+        tables.append(level_counts)
+
+    return compact_rollup(pd.concat(tables, ignore_index=True))
+
+def compact_rollup(rollup):
+    """Cast a roll-up to its stored dtypes and order."""
+    rollup = rollup[['level', 'key', 'parent', 'day', 'customer_count', 'gap_count']].copy()
+    for column in ['level', 'key', 'parent']:
+        rollup[column] = rollup[column].astype(str).astype('category')
+    rollup['day'] = rollup['day'].astype(np.int32)
+    rollup[['customer_count', 'gap_count']] = rollup[['customer_count', 'gap_count']].astype(np.int32)
+    return rollup.sort_values(['level', 'key', 'day'], ignore_index=True)
+
+def add_to_postcode_rollup(rollup, new_rollup):
+    """Merge the roll-up of newly appended customers into an existing roll-up."""
+    combined = (pd.concat([rollup.astype({'level': str, 'key': str, 'parent': str}),
+                           new_rollup.astype({'level': str, 'key': str, 'parent': str})], ignore_index=True)
+                .groupby(['level', 'key', 'parent', 'day'], sort=False)[['customer_count', 'gap_count']]
+                .sum()
+                .reset_index())
+    return compact_rollup(combined)
+
+def rollup_paths(customers_path=CUSTOMERS_FILE):
+    """Return the roll-up and metadata paths stored next to the customer file."""
+    base_dir = os.path.dirname(os.path.abspath(customers_path))
+    return os.path.join(base_dir, ROLLUP_FILE), os.path.join(base_dir, ROLLUP_META_FILE)
+
+def save_postcode_rollup(rollup, regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE, n_rows=None):
+    """
+    Save the roll-up as Parquet (dictionary-encoded keys) with a JSON metadata sidecar.
+    n_rows is the number of customer rows it covers, needed to extend it later.
+    """
+    rollup_path, meta_path = rollup_paths(customers_path)
+    tmp_path = rollup_path + '.tmp'
+    rollup.to_parquet(tmp_path, index=False, compression='zstd')
+    os.replace(tmp_path, rollup_path)
+    meta = {
+        'regions': file_fingerprint(regions_path),
+        'customers': file_fingerprint(customers_path),
+        **content_meta(customers_path, n_rows)
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_postcode_rollup(customers_path=CUSTOMERS_FILE):
+    """
+    Load the stored roll-up.
+
+    Returns:
+        tuple: (rollup, meta) or (None, None) if no roll-up has been saved.
+    """
+    rollup_path, meta_path = rollup_paths(customers_path)
+    if not (os.path.exists(rollup_path) and os.path.exists(meta_path)):
+        return None, None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return pd.read_parquet(rollup_path), meta
+
+def get_postcode_rollup(regions_gdf=None, customers_df=None, index=None,
+                        regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """
+    Return the stored roll-up, adding the new rows if the customer file was only
+    appended to and rebuilding it if either input file changed otherwise.
+    """
+    rollup, meta = load_postcode_rollup(customers_path)
+    regions_version = file_fingerprint(regions_path)
+    if rollup is not None and meta['regions'] == regions_version and meta['customers'] == file_fingerprint(customers_path):
+        return rollup
+
+    if customers_df is None:
+        customers_df = pd.read_csv(
+            customers_path,
+            usecols=lambda column: column in {'assigned_date', 'postal_code', 'latitude', 'longitude'}
+        )
+    if index is None:
+        index = get_assignment_index(regions_gdf, customers_df, regions_path, customers_path)
+
+    n_old = appended_rows(meta, customers_path) if rollup is not None and meta['regions'] == regions_version else None
+    if n_old is not None and n_old <= len(customers_df):
+        new_rollup = build_postcode_rollup(customers_df.iloc[n_old:].reset_index(drop=True), index_rows_from(index, n_old))
+        rollup = add_to_postcode_rollup(rollup, new_rollup)
+    else:
+        rollup = build_postcode_rollup(customers_df, index)
+    save_postcode_rollup(rollup, regions_path, customers_path, len(customers_df))
+    return rollup
+
+def drill_down(rollup, start_date=None, end_date=None, parent=None, parent_level=None):
+    """
+    Customer and gap counts one level below parent for an inclusive date window.
+
+    Args:
+        rollup (pd.DataFrame): Table from get_postcode_rollup
+        start_date, end_date: Window bounds; None leaves that side open
+        parent (str): None for all areas, an area (e.g. 'SW') for its districts, or
+            a district (e.g. 'SW1A') for its sectors
+        parent_level (str): 'area' or 'district'; inferred from parent if None, which
+            is only possible for keys that exist at one level (not 'Unknown')
+
+    Returns:
+        pd.DataFrame: key, customer_count and gap_count, busiest first
+    """
+    if parent is None:
+        level = 'area'
+    else:
+        if parent_level is None:
+            parent_levels = rollup.loc[rollup['key'] == parent, 'level'].astype(str).unique()
+            if len(parent_levels) == 0:
+                return pd.DataFrame(columns=['key', 'customer_count', 'gap_count'])
+            if len(parent_levels) > 1:
+                raise ValueError(f"'{parent}' is a key at several levels ({', '.join(sorted(parent_levels))}); "
+                                 "pass parent_level")
+            parent_level = parent_levels[0]
+        if parent_level not in LEVELS[:-1]:
+            raise ValueError(f"parent_level must be one of {LEVELS[:-1]}, got {parent_level!r}")
+        level = LEVELS[LEVELS.index(parent_level) + 1]
+
+    mask = (rollup['level'] == level).to_numpy(copy=True)
+    if parent is not None:
+        # Keys are unique within a level, so the parent key and level pick one node
+        mask &= (rollup['parent'] == parent).to_numpy()
+    if start_date is not None:
+        mask &= rollup['day'].to_numpy() >= date_to_ordinal(start_date)
+    if end_date is not None:
+        mask &= rollup['day'].to_numpy() <= date_to_ordinal(end_date)
+
+    counts = (rollup.loc[mask, ['key', 'customer_count', 'gap_count']]
+              .groupby('key', observed=True)
+              .sum()
+              .reset_index())
+    counts['key'] = counts['key'].astype(str)
+    return counts.sort_values(['customer_count', 'key'], ascending=[False, True], ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-aggregate customers by postcode area, district and sector')
+    parser.add_argument('--start_date', help='Start of the reporting window, YYYY-MM-DD')
+    parser.add_argument('--end_date', help='End of the reporting window, YYYY-MM-DD')
+    parser.add_argument('--parent', help='Area or district to drill into (default: list all areas)')
+    parser.add_argument('--parent_level', choices=LEVELS[:-1], help="Level of --parent, needed for 'Unknown'")
+    args = parser.parse_args()
+
+    rollup = get_postcode_rollup()
+    for level in LEVELS:
+        print(f"{level.title()}s: {rollup.loc[rollup['level'] == level, 'key'].nunique()}")
+
+    counts = drill_down(rollup, args.start_date, args.end_date, args.parent, args.parent_level)
+    print(f"\n{'Top of ' + args.parent if args.parent else 'Top areas'}:")
+    for _, row in counts.head(20).iterrows():
+        print(f"{row['key']}: {row['customer_count']} customers, {row['gap_count']} in service gaps")
+
+if __name__ == "__main__":
+    main()
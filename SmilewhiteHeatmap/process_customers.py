@@ -1,12 +1,20 @@
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
 from datetime import datetime, timedelta
 import json
+import argparse
+import numpy as np
+import pyarrow.parquet as pq
+from assignment_index import (build_assignment_index, build_region_tree, assign_points_to_regions,
+                              count_by_region, get_assignment_index)
+from region_day_counts import get_count_cube, period_bounds, period_counts, window_counts
+from region_raster import assign_points_by_raster, get_region_raster
+from distinct_counts import DEFAULT_ERROR, get_distinct_sketch, window_distinct_counts
 
-def load_data():
-    """Load and prepare all necessary data."""
-    # Load regions data
+STREAM_COLUMNS = ['assigned_date', 'latitude', 'longitude', 'postal_code']
+
+def load_regions():
+    """Load the regions data."""
     regions_gdf = gpd.read_file('regions.geojson')
     
     # Convert clinic_ids to string if it exists
@@ -16,125 +24,317 @@ def load_data():
         # If clinic_ids doesn't exist, create it as an empty list
         regions_gdf['clinic_ids'] = '[]'
     
+    return regions_gdf
+
+def load_data():
+    """Load and prepare all necessary data."""
+    # Load regions data
+    regions_gdf = load_regions()
+    
     # Load customer data
     customers_df = pd.read_csv('customers_with_latlon_cleaned.csv', low_memory=False)
     customers_df['assigned_date'] = pd.to_datetime(customers_df['assigned_date'])
     
     return regions_gdf, customers_df
 
+def iter_customer_chunks(customers_path, chunksize, columns=STREAM_COLUMNS):
+    """Yield the customer file as DataFrame chunks, from CSV chunks or Parquet row batches."""
+    if customers_path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(customers_path)
+        present = [c for c in columns if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(customers_path, chunksize=chunksize, usecols=lambda c: c in columns, low_memory=False)
+
 def find_gaps(customers_gdf, regions_gdf):
     """Find customers that don't fall within any region."""
-    gaps = []
-    for idx, customer in customers_gdf.iterrows():
-        customer_point = Point(customer['longitude'], customer['latitude'])
-        if not any(region.contains(customer_point) for region in regions_gdf.geometry):
-            # Create gap record with available fields
-            gap_record = {
-                'latitude': customer['latitude'],
-                'longitude': customer['longitude'],
-                'assigned_date': customer['assigned_date']
-            }
-            # Add postcode if it exists
-            if 'postal_code' in customer:
-                gap_record['postal_code'] = customer['postal_code']
-            gaps.append(gap_record)
-    return pd.DataFrame(gaps)
-
-def calculate_region_capacity(regions_gdf, customers_gdf, start_date, end_date):
-    """Calculate capacity ratios for each region in the given time period."""
+    _, gap_rows = count_by_region(build_assignment_index(regions_gdf, customers_gdf))
+    return gap_records(customers_gdf, gap_rows)
+
+def capacity_status(capacity_ratio):
+    """Map capacity ratios (scalar or array) to status labels."""
+    ratio = np.asarray(capacity_ratio, dtype=float)
+    conditions = [
+        np.isinf(ratio),
+        ratio == 0,
+        ratio <= 0.25,
+        ratio <= 0.5,
+        ratio <= 0.75,
+        ratio <= 0.9,
+        ratio <= 1.0
+    ]
+    choices = [
+        "No Availability",
+        "Empty",
+        "Low Utilization",
+        "Partially Full",
+        "Moderately Full",
+        "Near Capacity",
+        "At Capacity"
+    ]
+    return np.select(conditions, choices, default="Overcrowded")
+
+def weekly_hours_array(regions_gdf):
+    """Weekly availability hours per region, with invalid values treated as 0."""
+    weekly_hours = pd.to_numeric(regions_gdf['total_availability_hours'], errors='coerce')
+    for region_id in regions_gdf.loc[weekly_hours.isna(), 'region_id']:
+        print(f"Warning: Invalid total_availability_hours for region {region_id}")
+    return weekly_hours.fillna(0.0).to_numpy()
+
+def capacity_ratios(customer_counts, weekly_hours, days_in_period):
+    """Customers per available hour, broadcasting over regions and periods (inf where there are no hours)."""
+    period_hours = (weekly_hours / 7) * days_in_period
+    customer_counts = np.asarray(customer_counts, dtype=float)
+    capacity_ratio = np.full(np.broadcast(customer_counts, period_hours).shape, float('inf'))
+    np.divide(customer_counts, period_hours, out=capacity_ratio, where=period_hours > 0)
+    return capacity_ratio
+
+def apply_capacity_metrics(regions_gdf, customer_counts, days_in_period):
+    """Add customer_count, capacity_ratio and status columns for the given per-region counts."""
+    # Start with a copy of the regions GeoDataFrame to preserve all original data
+    metrics_gdf = regions_gdf.copy()
+    
+    capacity_ratio = capacity_ratios(customer_counts, weekly_hours_array(metrics_gdf), days_in_period)
+    
+    metrics_gdf['customer_count'] = np.asarray(customer_counts, dtype=float)
+    metrics_gdf['capacity_ratio'] = capacity_ratio
+    metrics_gdf['status'] = capacity_status(capacity_ratio)
+    return metrics_gdf
+
+def stream_region_capacity(regions_gdf, customers_path, start_date, end_date, chunksize=100000,
+                           gaps_path='service_gaps.csv', progress=None, raster=None):
+    """
+    Calculate capacity ratios for each region without loading the whole customer file.
+    
+    Customers are read in chunks and assigned to regions with one shared spatial
+    index. Per-region counts are accumulated in memory and gap records are appended
+    to gaps_path as they are found, so peak memory depends on chunksize only.
+    
+    Args:
+        regions_gdf (GeoDataFrame): Regions to assign customers to
+        customers_path (str): Customer CSV or Parquet file
+        start_date, end_date (pd.Timestamp): Period to calculate (limited to a week)
+        chunksize (int): Customer rows per chunk
+        gaps_path (str): CSV file the service gaps are written to
+        progress (callable, optional): Called as progress(rows_read, chunks_read) after each chunk
+        raster (tuple, optional): (labels, meta) from region_raster.py; points are then looked up
+            in the raster and only those in boundary cells are tested against polygons
+        
+    Returns:
+        tuple: (metrics_gdf, gap_count)
+    """
+    end_date, days_in_period = limit_to_week(start_date, end_date)
+    tree = build_region_tree(regions_gdf)
+    
+    customer_counts = np.zeros(len(regions_gdf), dtype=np.int64)
+    gap_count = 0
+    rows_read = 0
+    for chunks_read, chunk in enumerate(iter_customer_chunks(customers_path, chunksize), start=1):
+        rows_read += len(chunk)
+        chunk['assigned_date'] = pd.to_datetime(chunk['assigned_date'])
+        
+        # Filter the chunk by date range
+        mask = (chunk['assigned_date'] >= start_date) & (chunk['assigned_date'] <= end_date)
+        period_customers = chunk[mask]
+        
+        if raster is not None:
+            point_idx, region_idx = assign_points_by_raster(
+                regions_gdf,
+                *raster,
+                period_customers['longitude'],
+                period_customers['latitude'],
+                tree=tree,
+                verbose=False
+            )
+        else:
+            point_idx, region_idx = assign_points_to_regions(
+                regions_gdf,
+                period_customers['longitude'],
+                period_customers['latitude'],
+                tree=tree,
+                verbose=False
+            )
+        in_region = region_idx >= 0
+        customer_counts += np.bincount(region_idx[in_region], minlength=len(regions_gdf))
+        
+        # Append this chunk's gaps, writing the header with the first chunk
+        gaps_df = gap_records(period_customers, point_idx[~in_region])
+        gaps_df.to_csv(gaps_path, mode='w' if chunks_read == 1 else 'a', header=chunks_read == 1, index=False)
+        gap_count += len(gaps_df)
+        
+        if progress is not None:
+            progress(rows_read, chunks_read)
+    
+    return apply_capacity_metrics(regions_gdf, customer_counts, days_in_period), gap_count
+
+def first_assigned_date(customers_path, chunksize=100000):
+    """Find the earliest assigned_date by streaming only that column."""
+    first_date = None
+    for chunk in iter_customer_chunks(customers_path, chunksize, columns=['assigned_date']):
+        chunk_min = pd.to_datetime(chunk['assigned_date']).min()
+        if first_date is None or chunk_min < first_date:
+            first_date = chunk_min
+    return first_date
+
+def calculate_capacity_timeseries(regions_gdf, cube, window_days=7, step_days=7, align_weeks=True):
+    """
+    Calculate capacity for every region over every period in the data in one pass.
+    
+    Args:
+        regions_gdf (GeoDataFrame): Regions, in the order used to build the cube
+        cube (dict): Region × day count cube from region_day_counts.py
+        window_days (int): Length of each period in days
+        step_days (int): Days between consecutive period starts (less than window_days for rolling windows)
+        align_weeks (bool): Start periods on Mondays rather than on the first day of data
+        
+    Returns:
+        pd.DataFrame: Long format table with region_id, period_start, customer_count,
+        capacity_ratio and status. Periods at the edges of the data are rated on
+        the days they actually cover.
+    """
+    # Day offsets of every period, relative to the first day in the cube
+    starts, covered_starts, ends = period_bounds(cube, window_days, step_days, align_weeks)
+    
+    # Regions × periods counts from the prefix sums
+    customer_counts = period_counts(cube, covered_starts, ends)
+    days_in_period = ends - covered_starts
+    capacity_ratio = capacity_ratios(customer_counts, weekly_hours_array(regions_gdf)[:, None], days_in_period[None, :])
+    
+    period_start = (np.datetime64(int(cube['first_day']), 'D') + starts).astype('datetime64[ns]')
+    n_regions, n_periods = customer_counts.shape
+    return pd.DataFrame({
+        'region_id': np.repeat(regions_gdf['region_id'].to_numpy(), n_periods),
+        'period_start': np.tile(period_start, n_regions),
+        'customer_count': customer_counts.ravel(),
+        'capacity_ratio': capacity_ratio.ravel(),
+        'status': pd.Categorical(capacity_status(capacity_ratio).ravel())
+    })
+
+def gap_records(customers_df, rows):
+    """Build the service gap table for the given customer rows."""
+    columns = ['latitude', 'longitude', 'assigned_date']
+    if 'postal_code' in customers_df.columns:
+        columns.append('postal_code')
+    return customers_df.iloc[rows][columns].reset_index(drop=True)
+
+def limit_to_week(start_date, end_date):
+    """
+    Limit a date range to at most a week.
+    
+    Returns:
+        tuple: (end_date, days_in_period)
+    """
     # Ensure the date range is within a week
     date_diff = (end_date - start_date).days
     if date_diff > 7:
         end_date = start_date + timedelta(days=6)
+        print(f"Warning: Date range limited to one week ({start_date.date()} to {end_date.date()}); "
+              "use calculate_capacity_timeseries for longer periods")
+    
+    # Calculate days in the selected period
+    return end_date, min((end_date - start_date).days + 1, 7)
+
+def calculate_region_capacity(regions_gdf, customers_gdf, start_date, end_date, index=None, cube=None, sketch=None):
+    """
+    Calculate capacity ratios for each region in the given time period.
+    
+    If a customer to region index and count cube are given, counts are read from
+    the cube for whole days in the period instead of testing customers against regions.
+    If HyperLogLog sketches are also given, counts are approximate distinct customers.
+    """
+    end_date, days_in_period = limit_to_week(start_date, end_date)
+    
+    if index is not None and cube is not None:
+        if sketch is not None:
+            customer_counts, _ = window_distinct_counts(sketch, start_date, end_date)
+        else:
+            customer_counts, _ = window_counts(cube, start_date, end_date)
+        days = customers_gdf['assigned_date'].dt.normalize()
+        mask = (days >= pd.Timestamp(start_date).normalize()) & (days <= pd.Timestamp(end_date).normalize())
+        _, gap_rows = count_by_region(index, mask.to_numpy())
+        return apply_capacity_metrics(regions_gdf, customer_counts, days_in_period), gap_records(customers_gdf, gap_rows)
     
     # Filter customers by date range
     mask = (customers_gdf['assigned_date'] >= start_date) & (customers_gdf['assigned_date'] <= end_date)
     period_customers = customers_gdf[mask]
     
-    # Convert customers to GeoDataFrame
-    customers_gdf = gpd.GeoDataFrame(
-        period_customers,
-        geometry=[Point(xy) for xy in zip(period_customers['longitude'], period_customers['latitude'])],
-        crs="EPSG:4326"
-    )
+    # Assign the period's customers to regions and find gaps (customers not in any region)
+    customer_counts, gap_rows = count_by_region(build_assignment_index(regions_gdf, period_customers))
     
-    # Find gaps (customers not in any region)
-    gaps = []
-    for idx, customer in customers_gdf.iterrows():
-        customer_point = Point(customer['longitude'], customer['latitude'])
-        if not any(region.contains(customer_point) for region in regions_gdf.geometry):
-            gap_record = {
-                'latitude': customer['latitude'],
-                'longitude': customer['longitude'],
-                'assigned_date': customer['assigned_date']
-            }
-            if 'postal_code' in customer:
-                gap_record['postal_code'] = customer['postal_code']
-            gaps.append(gap_record)
-    gaps_df = pd.DataFrame(gaps)
-    
-    # Start with a copy of the regions GeoDataFrame to preserve all original data
-    metrics_gdf = regions_gdf.copy()
+    return apply_capacity_metrics(regions_gdf, customer_counts, days_in_period), gap_records(period_customers, gap_rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculate region capacity from customer data')
+    parser.add_argument('--timeseries', action='store_true', help='Calculate capacity for every period in the data')
+    parser.add_argument('--window_days', type=int, default=7, help='Length of each period in days (with --timeseries)')
+    parser.add_argument('--step_days', type=int, default=7, help='Days between period starts (with --timeseries)')
+    parser.add_argument('--stream', action='store_true', help='Read customers in chunks instead of loading the whole file')
+    parser.add_argument('--customers', default='customers_with_latlon_cleaned.csv', help='Customer CSV or Parquet file (with --stream)')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Customer rows per chunk (with --stream)')
+    parser.add_argument('--start_date', help='Start of the period, YYYY-MM-DD (with --stream, defaults to the first date in the data)')
+    parser.add_argument('--end_date', help='End of the period, YYYY-MM-DD (with --stream, defaults to a week after the start)')
+    parser.add_argument('--distinct', action='store_true', help='Count approximate distinct customers per region (HyperLogLog)')
+    parser.add_argument('--distinct_error', type=float, default=DEFAULT_ERROR, help='Target relative error of distinct counts (with --distinct)')
+    parser.add_argument('--raster', type=float, help='Assign customers with a region label raster of this cell size in metres (with --stream)')
+    args = parser.parse_args()
     
-    # Calculate additional metrics for each region
-    for idx, region in metrics_gdf.iterrows():
-        # Find customers in this region for the selected period
-        region_customers = customers_gdf[customers_gdf.geometry.within(region.geometry)]
-        customer_count = len(region_customers)
-        
-        # Get the weekly hours from the region data (already exists in the GeoDataFrame)
-        try:
-            weekly_hours = float(region['total_availability_hours'])
-        except (ValueError, TypeError):
-            weekly_hours = 0.0
-            print(f"Warning: Invalid total_availability_hours for region {region['region_id']}")
-        
-        # Calculate days in the selected period
-        days_in_period = min((end_date - start_date).days + 1, 7)
-        period_hours = (weekly_hours / 7) * days_in_period
+    if args.stream:
+        regions_gdf = load_regions()
+        start_date = pd.Timestamp(args.start_date) if args.start_date else first_assigned_date(args.customers, args.chunksize)
+        end_date = pd.Timestamp(args.end_date) if args.end_date else start_date + timedelta(days=6)
         
-        # Calculate capacity ratio
-        capacity_ratio = customer_count / period_hours if period_hours > 0 else float('inf')
+        metrics_gdf, gap_count = stream_region_capacity(
+            regions_gdf,
+            args.customers,
+            start_date,
+            end_date,
+            chunksize=args.chunksize,
+            progress=lambda rows, chunks: print(f"Processed {rows} customers ({chunks} chunks)"),
+            raster=get_region_raster(regions_gdf, resolution_m=args.raster) if args.raster else None
+        )
+        metrics_gdf.to_file('region_metrics.geojson', driver='GeoJSON')
         
-        # Determine status
-        if capacity_ratio == float('inf'):
-            status = "No Availability"
-        elif capacity_ratio == 0:
-            status = "Empty"
-        elif capacity_ratio <= 0.25:
-            status = "Low Utilization"
-        elif capacity_ratio <= 0.5:
-            status = "Partially Full"
-        elif capacity_ratio <= 0.75:
-            status = "Moderately Full"
-        elif capacity_ratio <= 0.9:
-            status = "Near Capacity"
-        elif capacity_ratio <= 1.0:
-            status = "At Capacity"
-        else:
-            status = "Overcrowded"
-        
-        # Update the metrics in the GeoDataFrame
-        metrics_gdf.at[idx, 'customer_count'] = customer_count
-        metrics_gdf.at[idx, 'capacity_ratio'] = capacity_ratio
-        metrics_gdf.at[idx, 'status'] = status
+        print(f"Processed {len(metrics_gdf)} regions")
+        print(f"Found {gap_count} service gaps")
+        print(f"Total weekly hours: {metrics_gdf['total_availability_hours'].sum():.1f}")
+        return
     
-    return metrics_gdf, gaps_df
-
-def main():
     # Load data
     regions_gdf, customers_df = load_data()
     
+    # Load the precomputed customer to region index and region × day count cube
+    index = get_assignment_index(regions_gdf, customers_df)
+    cube = get_count_cube(regions_gdf, customers_df, index)
+    sketch = get_distinct_sketch(regions_gdf, customers_df, index, args.distinct_error) if args.distinct else None
+    
     # Get date range from data
     min_date = customers_df['assigned_date'].min()
     max_date = customers_df['assigned_date'].max()
     
+    if args.timeseries:
+        timeseries_df = calculate_capacity_timeseries(
+            regions_gdf,
+            cube,
+            window_days=args.window_days,
+            step_days=args.step_days
+        )
+        timeseries_df.to_parquet('region_capacity_timeseries.parquet', index=False)
+        
+        print(f"Processed {len(regions_gdf)} regions over {timeseries_df['period_start'].nunique()} periods")
+        print(f"Date range: {min_date.date()} to {max_date.date()}")
+        print("Saved region_capacity_timeseries.parquet")
+        return
+    
     # Calculate metrics for the entire period
     metrics_gdf, gaps_df = calculate_region_capacity(
         regions_gdf,
         customers_df,
         min_date,
-        max_date
+        max_date,
+        index,
+        cube,
+        sketch
     )
     
     # Save results
@@ -148,4 +348,4 @@ def main():
     print(f"Total weekly hours: {metrics_gdf['total_availability_hours'].sum():.1f}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
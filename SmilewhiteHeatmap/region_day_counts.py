@@ -0,0 +1,233 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from assignment_index import (REGIONS_FILE, CUSTOMERS_FILE, appended_rows, content_meta, file_fingerprint,
+                              get_assignment_index, index_rows_from)
+
+CUBE_FILE = 'region_day_counts.npy'
+CUBE_META_FILE = 'region_day_counts.json'
+
+def day_ordinals(dates):
+    """Convert a datetime Series to integer days since 1970-01-01 (NaT becomes -1)."""
+    dates = pd.to_datetime(dates)
+    days = dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+    return np.where(dates.isna().to_numpy(), -1, days)
+
+def ordinal_to_date(ordinal):
+    """Convert a day ordinal back to a datetime.date."""
+    return np.datetime64(int(ordinal), 'D').astype(object)
+
+def date_to_ordinal(date):
+    """Convert a date or timestamp to a day ordinal."""
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+def count_pairs_by_day(index, days, first_day, n_days, rows=None):
+    """
+    Count (region, day) occurrences for customer rows in [first_day, first_day + n_days).
+
+    Returns:
+        np.ndarray: Counts of shape (n_regions + 1, n_days). The last row holds gaps.
+    """
+    n_regions = index['n_regions']
+    point_idx = index['point_idx']
+    region_idx = index['region_idx']
+    if rows is not None:
+        selected = np.zeros(len(days), dtype=bool)
+        selected[rows] = True
+        keep = selected[point_idx]
+        point_idx = point_idx[keep]
+        region_idx = region_idx[keep]
+
+    day_offset = days[point_idx] - first_day
+    valid = (day_offset >= 0) & (day_offset < n_days)
+    cube_row = np.where(region_idx[valid] >= 0, region_idx[valid], n_regions)
+
+    codes = cube_row.astype(np.int64) * n_days + day_offset[valid]
+    counts = np.bincount(codes, minlength=(n_regions + 1) * n_days)
+    return counts.reshape(n_regions + 1, n_days)
+
+def build_count_cube(index, days):
+    """
+    Build the cumulative region × day count cube.
+
+    Args:
+        index (dict): Customer to region index from assignment_index.py
+        days (np.ndarray): Day ordinal of every customer row
+
+    Returns:
+        dict: 'cumulative' is an int64 array of shape (n_regions + 1, n_days + 1) where
+        column 0 is zero and column d holds counts for the first d days. The last row
+        counts gaps. 'first_day' is the day ordinal of column 1 and 'n_rows' the
+        number of customer rows counted.
+    """
+    valid_days = days[days >= 0]
+    first_day = int(valid_days.min()) if len(valid_days) else 0
+    n_days = int(valid_days.max()) - first_day + 1 if len(valid_days) else 0
+
+    counts = count_pairs_by_day(index, days, first_day, n_days)
+    cumulative = np.zeros((index['n_regions'] + 1, n_days + 1), dtype=np.int64)
+    np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+    return {'cumulative': cumulative, 'first_day': first_day, 'n_regions': index['n_regions'], 'n_rows': len(days)}
+
+def add_to_count_cube(cube, index, days):
+    """
+    Add newly appended customer rows to a cube without recounting the history.
+
+    Args:
+        cube (dict): Existing cube
+        index (dict): Assignment index of the new rows only
+        days (np.ndarray): Day ordinal of each new row
+
+    Returns:
+        dict: The cube, widened if the new rows fall outside its days
+    """
+    cumulative = np.asarray(cube['cumulative'])
+    n_days = cumulative.shape[1] - 1
+    n_rows = None if cube.get('n_rows') is None else cube['n_rows'] + len(days)
+    valid_days = days[days >= 0]
+    if not len(valid_days):
+        return {**cube, 'n_rows': n_rows}
+
+    old_first = cube['first_day'] if n_days else int(valid_days.min())
+    first_day = min(old_first, int(valid_days.min()))
+    last_day = max(old_first + n_days - 1, int(valid_days.max()))
+    total_days = last_day - first_day + 1
+
+    # Place the old totals in the wider day range; later days carry the old final totals
+    lead = old_first - first_day
+    extended = np.zeros((cumulative.shape[0], total_days + 1), dtype=np.int64)
+    extended[:, lead + 1:lead + n_days + 1] = cumulative[:, 1:]
+    extended[:, lead + n_days + 1:] = cumulative[:, -1:]
+
+    counts = count_pairs_by_day(index, days, first_day, total_days)
+    extended[:, 1:] += np.cumsum(counts, axis=1)
+    return {'cumulative': extended, 'first_day': first_day, 'n_regions': cube['n_regions'], 'n_rows': n_rows}
+
+def window_counts(cube, start_date, end_date):
+    """
+    Customer counts for an inclusive date window in O(regions).
+
+    Returns:
+        tuple: (region_counts, gap_count)
+    """
+    cumulative = cube['cumulative']
+    n_days = cumulative.shape[1] - 1
+    start = min(max(date_to_ordinal(start_date) - cube['first_day'], 0), n_days)
+    end = min(max(date_to_ordinal(end_date) - cube['first_day'] + 1, start), n_days)
+    counts = cumulative[:, end] - cumulative[:, start]
+    return counts[:-1], int(counts[-1])
+
+def period_bounds(cube, window_days=7, step_days=7, align_weeks=True):
+    """
+    Day offsets of consecutive periods covering the cube.
+
+    Returns:
+        tuple: (starts, covered_starts, ends) where starts are the nominal period
+        starts (possibly before the first day when aligned to Mondays) and
+        [covered_starts, ends) is the part of each period covered by the cube
+    """
+    n_days = cube['cumulative'].shape[1] - 1
+    offset = (cube['first_day'] + 3) % 7 if align_weeks else 0  # day 0 (1970-01-01) was a Thursday
+    starts = np.arange(-offset, n_days, step_days)
+    covered_starts = np.maximum(starts, 0)
+    ends = np.minimum(starts + window_days, n_days)
+    return starts, covered_starts, ends
+
+def period_counts(cube, covered_starts, ends):
+    """Regions × periods count matrix (gaps excluded) for the given day offsets."""
+    cumulative = cube['cumulative']
+    return cumulative[:-1, ends] - cumulative[:-1, covered_starts]
+
+def cube_paths(regions_path=REGIONS_FILE):
+    """Return the cube and metadata paths stored next to the regions artifact."""
+    base_dir = os.path.dirname(os.path.abspath(regions_path))
+    return os.path.join(base_dir, CUBE_FILE), os.path.join(base_dir, CUBE_META_FILE)
+
+def save_count_cube(cube, regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """Save the cube as a memory-mappable .npy file with a JSON metadata sidecar."""
+    cube_path, meta_path = cube_paths(regions_path)
+
+    # Write to a new file and swap it in so readers holding a memory map are not affected
+    tmp_path = cube_path + '.tmp.npy'
+    np.save(tmp_path, cube['cumulative'])
+    os.replace(tmp_path, cube_path)
+    meta = {
+        'regions': file_fingerprint(regions_path),
+        'customers': file_fingerprint(customers_path),
+        'first_day': int(cube['first_day']),
+        'n_regions': int(cube['n_regions']),
+        **content_meta(customers_path, cube.get('n_rows'))
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_count_cube(regions_path=REGIONS_FILE, mmap_mode='r'):
+    """
+    Load a stored cube, memory-mapped by default.
+
+    Returns:
+        tuple: (cube, meta) or (None, None) if no cube has been saved.
+    """
+    cube_path, meta_path = cube_paths(regions_path)
+    if not (os.path.exists(cube_path) and os.path.exists(meta_path)):
+        return None, None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    cube = {
+        'cumulative': np.load(cube_path, mmap_mode=mmap_mode),
+        'first_day': meta['first_day'],
+        'n_regions': meta['n_regions'],
+        'n_rows': meta.get('customers_rows')
+    }
+    return cube, meta
+
+def get_count_cube(regions_gdf=None, customers_df=None, index=None,
+                   regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """
+    Return an up-to-date count cube.
+
+    The stored cube is used as-is if neither input file changed, has the new rows
+    added if the customer file was only appended to (checked by hashing the content
+    the cube was built from), and is rebuilt otherwise.
+    """
+    cube, meta = load_count_cube(regions_path)
+    customers_version = file_fingerprint(customers_path)
+    regions_version = file_fingerprint(regions_path)
+    if cube is not None and meta['regions'] == regions_version and meta['customers'] == customers_version:
+        return cube
+
+    if customers_df is None:
+        customers_df = pd.read_csv(customers_path, usecols=['assigned_date', 'latitude', 'longitude'])
+    if index is None:
+        index = get_assignment_index(regions_gdf, customers_df, regions_path, customers_path)
+    days = day_ordinals(customers_df['assigned_date'])
+
+    n_old = appended_rows(meta, customers_path) if cube is not None and meta['regions'] == regions_version else None
+    if n_old is not None and n_old <= len(days):
+        cube = add_to_count_cube(cube, index_rows_from(index, n_old), days[n_old:])
+    else:
+        cube = build_count_cube(index, days)
+
+    save_count_cube(cube, regions_path, customers_path)
+    return cube
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the region × day customer count cube')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    parser.add_argument('--customers', default=CUSTOMERS_FILE, help='Cleaned customers CSV file')
+    args = parser.parse_args()
+
+    cube = get_count_cube(regions_path=args.regions, customers_path=args.customers)
+    n_days = cube['cumulative'].shape[1] - 1
+
+    print(f"Count cube: {cube['n_regions']} regions × {n_days} days")
+    if n_days:
+        print(f"Days: {ordinal_to_date(cube['first_day'])} to {ordinal_to_date(cube['first_day'] + n_days - 1)}")
+    print(f"Customer-region assignments: {cube['cumulative'][:-1, -1].sum()}")
+    print(f"Total service gaps: {cube['cumulative'][-1, -1]}")
+
+if __name__ == "__main__":
+    main()
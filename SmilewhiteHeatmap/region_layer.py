@@ -0,0 +1,109 @@
+import numpy as np
+import shapely
+import folium
+from folium.plugins import VectorGridProtobuf
+from branca.colormap import LinearColormap
+
+COORDINATE_DECIMALS = 5  # about 1 m, well below what the map can show
+
+POPUP_FIELDS = ['region_id', 'status', 'weekly_hours', 'customer_count', 'ratio_label', 'clinic_count']
+POPUP_ALIASES = ['Region', 'Status', 'Weekly Hours', 'Current Customers', 'Capacity Ratio', 'Number of Clinics']
+
+DEFAULT_TILE_URL = 'http://127.0.0.1:8765'
+
+# Region statuses shown by the app, tile server and timeline, in order of increasing capacity ratio
+STATUSES = ['No customers', 'Under capacity', 'Optimal capacity', 'Over capacity']
+
+# Leaflet.VectorGrid style for the 'regions' layer written by tile_server.py
+TILE_LAYER_OPTIONS = """{
+    "vectorTileLayerStyles": {
+        "regions": function(properties, zoom) {
+            return {
+                "fill": true,
+                "fillColor": properties.fill_color,
+                "fillOpacity": 0.7,
+                "color": "black",
+                "weight": 1
+            };
+        }
+    },
+    "interactive": true,
+    "getFeatureId": function(feature) { return feature.properties.region_id; }
+}"""
+
+def status_codes(capacity_ratio):
+    """Index into STATUSES for capacity ratios (scalar or array); NaN and inf count as over capacity."""
+    ratio = np.asarray(capacity_ratio, dtype=float)
+    return np.select([ratio == 0, ratio < 0.5, ratio < 1], [0, 1, 2], default=3)
+
+def region_status(capacity_ratio):
+    """Status labels for capacity ratios (scalar or array)."""
+    return np.asarray(STATUSES)[status_codes(capacity_ratio)]
+
+def create_color_scale():
+    """Create a color scale for capacity ratios."""
+    return LinearColormap(
+        colors=['green', 'yellow', 'red'],
+        vmin=0,
+        vmax=2,
+        caption='Capacity Ratio (Customers/Hour)'
+    )
+
+def region_feature_collection(metrics_gdf, color_scale, decimals=COORDINATE_DECIMALS):
+    """
+    Build one GeoJSON FeatureCollection for all regions.
+
+    Each feature carries its fill colour and popup values as properties, and
+    coordinates are rounded to the given number of decimals to keep the page small.
+
+    Args:
+        metrics_gdf (GeoDataFrame): Regions with capacity metrics
+        color_scale (LinearColormap): Colour scale for capacity ratios
+        decimals (int): Coordinate precision
+
+    Returns:
+        dict: GeoJSON FeatureCollection
+    """
+    ratio = metrics_gdf['capacity_ratio'].to_numpy(dtype=float)
+    finite = np.isfinite(ratio)
+
+    features_gdf = metrics_gdf[['region_id', 'status', 'customer_count']].copy()
+    features_gdf['weekly_hours'] = metrics_gdf['total_availability_hours'].round(1)
+    features_gdf['ratio_label'] = [f"{r:.2f}" if ok else "No availability" for r, ok in zip(ratio, finite)]
+    features_gdf['clinic_count'] = metrics_gdf['clinic_count'] if 'clinic_count' in metrics_gdf.columns else 0
+    features_gdf['fill_color'] = [color_scale(r) if ok else 'gray' for r, ok in zip(ratio, finite)]
+    features_gdf = features_gdf.set_geometry(
+        shapely.transform(metrics_gdf.geometry.values, lambda coords: np.round(coords, decimals)),
+        crs=metrics_gdf.crs
+    )
+    return features_gdf.to_geo_dict(drop_id=True)
+
+def region_style(feature):
+    """Style a region from its own fill_color property."""
+    return {
+        'fillColor': feature['properties']['fill_color'],
+        'color': 'black',
+        'weight': 1,
+        'fillOpacity': 0.7
+    }
+
+def add_region_layer(m, metrics_gdf, color_scale, decimals=COORDINATE_DECIMALS):
+    """Add all regions to the map as a single styled GeoJSON layer with a shared popup and tooltip."""
+    folium.GeoJson(
+        region_feature_collection(metrics_gdf, color_scale, decimals),
+        name='Regions',
+        style_function=region_style,
+        popup=folium.GeoJsonPopup(fields=POPUP_FIELDS, aliases=POPUP_ALIASES, max_width=300),
+        tooltip=folium.GeoJsonTooltip(fields=['region_id', 'status'], aliases=['Region', 'Status'])
+    ).add_to(m)
+
+def add_region_tile_layer(m, start_date, end_date, tile_url=DEFAULT_TILE_URL):
+    """
+    Add the regions as a vector-tile layer served by tile_server.py, so the browser
+    only fetches the tiles in view instead of every region's geometry.
+    """
+    VectorGridProtobuf(
+        f"{tile_url.rstrip('/')}/regions/{start_date}/{end_date}/{{z}}/{{x}}/{{y}}.pbf",
+        'Regions',
+        TILE_LAYER_OPTIONS
+    ).add_to(m)
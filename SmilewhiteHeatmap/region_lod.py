@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+import numpy as np
+import shapely
+import geopandas as gpd
+from assignment_index import REGIONS_FILE, file_fingerprint
+
+LOD_FILE = 'regions_lod.parquet'
+LOD_META_FILE = 'regions_lod.json'
+LOD_ZOOMS = [4, 6, 8, 10]  # closer zooms use the full-precision geometry
+TILE_SIZE = 256
+
+def zoom_tolerance(zoom, pixels=0.5):
+    """Simplification tolerance in degrees that stays below the given number of screen pixels at a zoom."""
+    return 360 / (TILE_SIZE * 2 ** zoom) * pixels
+
+def build_region_lod(regions_gdf, zooms=LOD_ZOOMS):
+    """
+    Simplify the region geometries once per zoom level.
+
+    Topology-preserving simplification keeps every polygon valid and never
+    collapses a region, however small it is at that zoom.
+
+    Returns:
+        dict: zoom -> array of simplified geometries in regions_gdf order
+    """
+    geometries = np.asarray(regions_gdf.geometry.values)
+    return {
+        zoom: shapely.simplify(geometries, zoom_tolerance(zoom), preserve_topology=True)
+        for zoom in zooms
+    }
+
+def lod_paths(regions_path=REGIONS_FILE):
+    """Return the pyramid and metadata paths stored next to the regions artifact."""
+    base_dir = os.path.dirname(os.path.abspath(regions_path))
+    return os.path.join(base_dir, LOD_FILE), os.path.join(base_dir, LOD_META_FILE)
+
+def save_region_lod(lod, crs, regions_path=REGIONS_FILE):
+    """Save all levels in one GeoParquet file with a JSON metadata sidecar."""
+    lod_path, meta_path = lod_paths(regions_path)
+    zooms = sorted(lod)
+    levels_gdf = gpd.GeoDataFrame({
+        'lod_zoom': np.repeat(zooms, [len(lod[zoom]) for zoom in zooms]).astype(np.int8),
+        'region': np.concatenate([np.arange(len(lod[zoom]), dtype=np.int32) for zoom in zooms]),
+    }, geometry=np.concatenate([lod[zoom] for zoom in zooms]), crs=crs)
+
+    tmp_path = lod_path + '.tmp'
+    levels_gdf.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, lod_path)
+    meta = {
+        'regions': file_fingerprint(regions_path),
+        'levels': [{'zoom': zoom,
+                    'tolerance': zoom_tolerance(zoom),
+                    'vertices': int(shapely.get_num_coordinates(lod[zoom]).sum())} for zoom in zooms]
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_region_lod(regions_path=REGIONS_FILE):
+    """
+    Load the stored pyramid if it was built from the current regions file.
+
+    Returns:
+        dict or None: zoom -> geometry array, or None if missing or stale
+    """
+    lod_path, meta_path = lod_paths(regions_path)
+    if not (os.path.exists(lod_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['regions'] != file_fingerprint(regions_path):
+        return None
+
+    levels_gdf = gpd.read_parquet(lod_path).sort_values(['lod_zoom', 'region'])
+    geometries = np.asarray(levels_gdf.geometry.values)
+    return {
+        int(zoom): geometries[(levels_gdf['lod_zoom'] == zoom).to_numpy()]
+        for zoom in levels_gdf['lod_zoom'].unique()
+    }
+
+def get_region_lod(regions_gdf=None, regions_path=REGIONS_FILE, zooms=LOD_ZOOMS):
+    """Return the level-of-detail pyramid, rebuilding it if regions.geojson changed."""
+    lod = load_region_lod(regions_path)
+    if lod is not None and sorted(lod) == sorted(zooms):
+        return lod
+
+    if regions_gdf is None:
+        regions_gdf = gpd.read_file(regions_path)
+    lod = build_region_lod(regions_gdf, zooms)
+    save_region_lod(lod, regions_gdf.crs, regions_path)
+    return lod
+
+def lod_zoom_for(lod, zoom):
+    """
+    The pyramid level to draw at a map zoom: the coarsest level made for that zoom
+    or closer, or None for full detail.
+    """
+    levels = [level for level in sorted(lod) if level >= zoom]
+    return levels[0] if levels else None
+
+def geometry_for_zoom(lod, regions_gdf, zoom):
+    """Region geometries to draw at a map zoom, in regions_gdf order."""
+    level = lod_zoom_for(lod, zoom)
+    if level is None:
+        return np.asarray(regions_gdf.geometry.values)
+    return lod[level]
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute simplified region geometries for each map zoom level')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    args = parser.parse_args()
+
+    regions_gdf = gpd.read_file(args.regions)
+    lod = get_region_lod(regions_gdf, args.regions)
+
+    full_vertices = int(shapely.get_num_coordinates(np.asarray(regions_gdf.geometry.values)).sum())
+    print(f"Full detail: {full_vertices} vertices in {len(regions_gdf)} regions")
+    for zoom in sorted(lod):
+        vertices = int(shapely.get_num_coordinates(lod[zoom]).sum())
+        print(f"Zoom <= {zoom:>2}: tolerance {zoom_tolerance(zoom):.5f}°, {vertices} vertices "
+              f"({vertices / full_vertices:.0%} of full detail)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+from assignment_index import REGIONS_FILE, file_fingerprint, assign_points_to_regions
+
+RASTER_FILE = 'region_raster.npy'
+RASTER_META_FILE = 'region_raster.json'
+RASTER_CRS = 'EPSG:27700'  # British National Grid, in metres
+
+GAP = -1
+BOUNDARY = -2
+
+def build_region_raster(regions_gdf, resolution_m=100):
+    """
+    Rasterize regions into a label grid in British National Grid coordinates.
+
+    Each cell holds the position of the region covering it, GAP if no region
+    covers it, or BOUNDARY if a region boundary crosses the cell or regions
+    overlap there. Only BOUNDARY cells need an exact polygon test.
+
+    The grid spans the bounds of the regions; everything outside is a gap.
+
+    Args:
+        regions_gdf (GeoDataFrame): Regions in EPSG:4326
+        resolution_m (float): Cell size in metres
+
+    Returns:
+        tuple: (labels, meta) where labels is an int32 array of shape (rows, cols)
+        with row 0 at the southern edge
+    """
+    # Densify edges before projecting so the projected outlines follow the true boundaries
+    geometries = shapely.segmentize(np.asarray(regions_gdf.geometry.values), max_segment_length=0.005)
+    projected = gpd.GeoSeries(geometries, crs=regions_gdf.crs).to_crs(RASTER_CRS).values
+
+    minx, miny, maxx, maxy = shapely.total_bounds(projected)
+    x0 = np.floor(minx / resolution_m) * resolution_m
+    y0 = np.floor(miny / resolution_m) * resolution_m
+    n_cols = int(np.ceil((maxx - x0) / resolution_m)) + 1
+    n_rows = int(np.ceil((maxy - y0) / resolution_m)) + 1
+
+    labels = np.full((n_rows, n_cols), GAP, dtype=np.int32)
+    boundary = np.zeros((n_rows, n_cols), dtype=bool)
+
+    for i, geom in enumerate(projected):
+        if geom is None or geom.is_empty:
+            continue
+
+        # Sample the boundary at least twice per cell; every cell it crosses is next to a sampled cell
+        samples = shapely.get_coordinates(shapely.segmentize(geom.boundary, resolution_m / 2))
+        sample_cols = ((samples[:, 0] - x0) // resolution_m).astype(np.int64)
+        sample_rows = ((samples[:, 1] - y0) // resolution_m).astype(np.int64)
+        boundary[sample_rows, sample_cols] = True
+
+        # Label the cells whose centres are inside this region
+        gminx, gminy, gmaxx, gmaxy = geom.bounds
+        c0, c1 = int((gminx - x0) // resolution_m), int((gmaxx - x0) // resolution_m) + 1
+        r0, r1 = int((gminy - y0) // resolution_m), int((gmaxy - y0) // resolution_m) + 1
+        centre_x = x0 + (np.arange(c0, c1) + 0.5) * resolution_m
+        centre_y = y0 + (np.arange(r0, r1) + 0.5) * resolution_m
+        grid_x, grid_y = np.meshgrid(centre_x, centre_y)
+
+        shapely.prepare(geom)
+        inside = shapely.contains_xy(geom, grid_x, grid_y)
+        window = labels[r0:r1, c0:c1]
+        boundary[r0:r1, c0:c1] |= inside & (window >= 0)  # overlapping regions
+        window[inside & (window == GAP)] = i
+
+    # Flag the 3x3 neighbourhood of every sampled boundary cell
+    flagged = boundary.copy()
+    flagged[1:, :] |= boundary[:-1, :]
+    flagged[:-1, :] |= boundary[1:, :]
+    grown = flagged.copy()
+    grown[:, 1:] |= flagged[:, :-1]
+    grown[:, :-1] |= flagged[:, 1:]
+    labels[grown] = BOUNDARY
+
+    meta = {
+        'crs': RASTER_CRS,
+        'resolution_m': float(resolution_m),
+        'x0': float(x0),
+        'y0': float(y0),
+        'n_rows': n_rows,
+        'n_cols': n_cols,
+        'n_regions': len(regions_gdf)
+    }
+    return labels, meta
+
+def raster_paths(regions_path=REGIONS_FILE):
+    """Return the raster and metadata paths stored next to the regions artifact."""
+    base_dir = os.path.dirname(os.path.abspath(regions_path))
+    return os.path.join(base_dir, RASTER_FILE), os.path.join(base_dir, RASTER_META_FILE)
+
+def get_region_raster(regions_gdf=None, regions_path=REGIONS_FILE, resolution_m=100):
+    """
+    Return the memory-mapped label raster, rebuilding it if regions.geojson or
+    the resolution changed since it was saved.
+
+    Returns:
+        tuple: (labels, meta)
+    """
+    raster_path, meta_path = raster_paths(regions_path)
+    if os.path.exists(raster_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['regions'] == file_fingerprint(regions_path) and meta['resolution_m'] == float(resolution_m):
+            return np.load(raster_path, mmap_mode='r'), meta
+
+    if regions_gdf is None:
+        regions_gdf = gpd.read_file(regions_path)
+    labels, meta = build_region_raster(regions_gdf, resolution_m)
+    meta['regions'] = file_fingerprint(regions_path)
+
+    # Write to a new file and swap it in so readers holding a memory map are not affected
+    tmp_path = raster_path + '.tmp.npy'
+    np.save(tmp_path, labels)
+    os.replace(tmp_path, raster_path)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return np.load(raster_path, mmap_mode='r'), meta
+
+def lookup_labels(labels, meta, longitudes, latitudes):
+    """Raster label under each point (GAP outside the raster or for missing coordinates)."""
+    transformer = Transformer.from_crs('EPSG:4326', meta['crs'], always_xy=True)
+    x, y = transformer.transform(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+
+    col = np.floor((x - meta['x0']) / meta['resolution_m'])
+    row = np.floor((y - meta['y0']) / meta['resolution_m'])
+    on_grid = (col >= 0) & (col < meta['n_cols']) & (row >= 0) & (row < meta['n_rows'])
+
+    point_labels = np.full(len(x), GAP, dtype=np.int32)
+    point_labels[on_grid] = labels[row[on_grid].astype(np.int64), col[on_grid].astype(np.int64)]
+    return point_labels
+
+def assign_points_by_raster(regions_gdf, labels, meta, longitudes, latitudes, tree=None, verbose=True):
+    """
+    Assign points to regions with one raster gather, testing polygons only for
+    points in BOUNDARY cells.
+
+    Returns:
+        tuple: (point_idx, region_idx) in the same layout as assign_points_to_regions
+    """
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    point_labels = lookup_labels(labels, meta, longitudes, latitudes)
+
+    exact_rows = np.flatnonzero(point_labels == BOUNDARY)
+    if verbose and len(point_labels):
+        print(f"Raster lookup resolved {1 - len(exact_rows) / len(point_labels):.1%} of points; "
+              f"{len(exact_rows)} need an exact test")
+
+    resolved_rows = np.flatnonzero(point_labels != BOUNDARY)
+    exact_points, exact_regions = assign_points_to_regions(
+        regions_gdf, longitudes[exact_rows], latitudes[exact_rows], tree=tree, verbose=False
+    )
+
+    point_idx = np.concatenate([resolved_rows, exact_rows[exact_points]])
+    region_idx = np.concatenate([point_labels[resolved_rows], exact_regions])
+    order = np.lexsort((region_idx, point_idx))
+    return point_idx[order].astype(np.int32), region_idx[order].astype(np.int32)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the region label raster')
+    parser.add_argument('--resolution', type=float, default=100, help='Cell size in metres (EPSG:27700)')
+    parser.add_argument('--customers', help='Customers CSV to benchmark raster assignment against polygon tests')
+    args = parser.parse_args()
+
+    regions_gdf = gpd.read_file(REGIONS_FILE)
+    start = time.perf_counter()
+    labels, meta = get_region_raster(regions_gdf, resolution_m=args.resolution)
+    print(f"Raster: {meta['n_rows']} × {meta['n_cols']} cells at {meta['resolution_m']:.0f} m "
+          f"({time.perf_counter() - start:.1f}s)")
+    print(f"Boundary cells: {(labels == BOUNDARY).mean():.2%}")
+
+    if args.customers:
+        customers_df = pd.read_csv(args.customers, usecols=['latitude', 'longitude'])
+
+        start = time.perf_counter()
+        raster_pairs = assign_points_by_raster(regions_gdf, labels, meta, customers_df['longitude'], customers_df['latitude'])
+        raster_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        polygon_pairs = assign_points_to_regions(regions_gdf, customers_df['longitude'], customers_df['latitude'])
+        polygon_seconds = time.perf_counter() - start
+
+        identical = all(np.array_equal(a, b) for a, b in zip(raster_pairs, polygon_pairs))
+        print(f"Raster assignment: {raster_seconds:.3f}s, polygon assignment: {polygon_seconds:.3f}s")
+        print(f"Identical results: {identical}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import heapq
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import scipy.sparse as sp
+from sklearn.neighbors import KDTree
+from generate_grids import km_to_deg
+from assignment_index import factorize_coordinates, get_assignment_index
+
+RECOMMENDATION_COLUMNS = ['rank', 'clinic_id', 'name', 'postcode', 'latitude', 'longitude',
+                          'marginal_gain', 'cumulative_covered', 'cumulative_share']
+
+def to_grid_km(latitudes, longitudes):
+    """
+    Scale coordinates so that the square catchments from create_square_grid
+    become Chebyshev balls of radius grid_size.
+    """
+    deg = km_to_deg(1)
+    return np.column_stack([np.asarray(latitudes, dtype=float) / deg['lat'],
+                            np.asarray(longitudes, dtype=float) / deg['lon']])
+
+def build_coverage_matrix(candidates_df, demand_lat, demand_lon, grid_size_km):
+    """
+    Build the sparse candidates × demand points coverage matrix.
+
+    A candidate covers a demand point if the point lies in the candidate's
+    square catchment of half-width grid_size_km.
+
+    Returns:
+        sp.csr_matrix: Boolean coverage, one row per candidate; empty if there
+        is no demand or no candidate
+    """
+    if len(demand_lat) == 0 or len(candidates_df) == 0:
+        return sp.csr_matrix((len(candidates_df), len(demand_lat)), dtype=bool)
+    tree = KDTree(to_grid_km(demand_lat, demand_lon), metric='chebyshev')
+    covered = tree.query_radius(to_grid_km(candidates_df['latitude'], candidates_df['longitude']), r=grid_size_km)
+
+    indptr = np.concatenate([[0], np.cumsum([len(idx) for idx in covered])])
+    indices = np.concatenate(covered) if len(covered) else np.array([], dtype=np.int64)
+    return sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                         shape=(len(candidates_df), len(demand_lat)))
+
+def greedy_max_coverage(coverage, weights, n_sites):
+    """
+    Pick up to n_sites candidates that together cover the most demand.
+
+    Uses lazy greedy evaluation: a candidate's gain can only shrink as more
+    sites are picked, so stale gains in the priority queue are upper bounds
+    and only the top candidate needs re-evaluating.
+
+    Returns:
+        list: (candidate_idx, marginal_gain) for each pick, in order
+    """
+    covered = np.zeros(coverage.shape[1], dtype=bool)
+    initial_gains = coverage @ weights
+    heap = [(-gain, c) for c, gain in enumerate(initial_gains) if gain > 0]
+    heapq.heapify(heap)
+
+    picks = []
+    while heap and len(picks) < n_sites:
+        _, candidate = heapq.heappop(heap)
+        points = coverage.indices[coverage.indptr[candidate]:coverage.indptr[candidate + 1]]
+        gain = weights[points[~covered[points]]].sum()
+
+        # Re-queue if another candidate's (upper-bound) gain is now higher
+        if heap and gain < -heap[0][0]:
+            if gain > 0:
+                heapq.heappush(heap, (-gain, candidate))
+            continue
+        if gain <= 0:
+            break
+
+        covered[points] = True
+        picks.append((candidate, gain))
+    return picks
+
+def load_demand(demand, metrics_path='region_metrics.geojson'):
+    """
+    Load demand points with weights.
+
+    'gaps' uses service_gaps.csv with weight 1 per customer; an empty gaps file
+    (process_customers.py writes one without columns when there are no gaps) is
+    no demand. 'all' uses every customer, weighted 1 for gaps and by the region's
+    excess share (1 - 1 / capacity_ratio) for customers in over-capacity regions.
+
+    Returns:
+        tuple: (latitudes, longitudes, weights) for unique demand locations
+    """
+    if demand == 'gaps':
+        try:
+            customers_df = pd.read_csv('service_gaps.csv')
+        except pd.errors.EmptyDataError:
+            customers_df = pd.DataFrame()
+        if not {'latitude', 'longitude'}.issubset(customers_df.columns):
+            customers_df = pd.DataFrame({'latitude': [], 'longitude': []})
+        customer_weights = np.ones(len(customers_df))
+    else:
+        regions_gdf = gpd.read_file('regions.geojson')
+        customers_df = pd.read_csv('customers_with_latlon_cleaned.csv', usecols=['latitude', 'longitude'])
+        index = get_assignment_index(regions_gdf, customers_df)
+
+        metrics_gdf = gpd.read_file(metrics_path)
+        ratio = metrics_gdf['capacity_ratio'].to_numpy(dtype=float)
+        excess = np.zeros(len(ratio))
+        excess[ratio > 1] = 1 - 1 / ratio[ratio > 1]
+
+        # Gaps count fully; overlapping regions count with their largest excess share
+        pair_weights = np.where(index['region_idx'] >= 0, excess[index['region_idx']], 1.0)
+        customer_weights = np.zeros(len(customers_df))
+        np.maximum.at(customer_weights, index['point_idx'], pair_weights)
+
+    customers_df = customers_df.assign(weight=customer_weights).dropna(subset=['latitude', 'longitude'])
+    customers_df = customers_df[customers_df['weight'] > 0]
+
+    codes, unique_lon, unique_lat = factorize_coordinates(customers_df['longitude'], customers_df['latitude'])
+    weights = np.bincount(codes, weights=customers_df['weight'].to_numpy(), minlength=len(unique_lon))
+    return unique_lat, unique_lon, weights
+
+def main():
+    parser = argparse.ArgumentParser(description='Recommend new clinic locations that cover the most unmet demand')
+    parser.add_argument('--n_sites', type=int, default=10, help='Number of sites to recommend')
+    parser.add_argument('--grid_size', type=float, default=20, help='Catchment half-width in kilometres, as in generate_grids.py')
+    parser.add_argument('--demand', choices=['gaps', 'all'], default='gaps',
+                        help='Demand to cover: service gaps only, or all customers weighted by unmet share')
+    parser.add_argument('--candidates', default='dentist_data_map_random_hours.csv',
+                        help='Clinic file; inactive clinics are the candidate sites')
+    args = parser.parse_args()
+
+    candidates_df = pd.read_csv(args.candidates)
+    candidates_df = candidates_df[candidates_df['active'] == 0].dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+
+    demand_lat, demand_lon, weights = load_demand(args.demand)
+    if weights.sum() <= 0:
+        pd.DataFrame(columns=RECOMMENDATION_COLUMNS).to_csv('recommended_sites.csv', index=False)
+        print(f"No demand to cover ({args.demand}); saved an empty recommended_sites.csv")
+        return
+    coverage = build_coverage_matrix(candidates_df, demand_lat, demand_lon, args.grid_size)
+    picks = greedy_max_coverage(coverage, weights, args.n_sites)
+
+    total_demand = weights.sum()
+    rows = []
+    cumulative = 0.0
+    for rank, (candidate, gain) in enumerate(picks, start=1):
+        cumulative += gain
+        site = candidates_df.iloc[candidate]
+        rows.append({
+            'rank': rank,
+            'clinic_id': site['id'],
+            'name': site['name'],
+            'postcode': site['postcode'],
+            'latitude': site['latitude'],
+            'longitude': site['longitude'],
+            'marginal_gain': gain,
+            'cumulative_covered': cumulative,
+            'cumulative_share': cumulative / total_demand if total_demand > 0 else 0.0
+        })
+    recommendations_df = pd.DataFrame(rows, columns=RECOMMENDATION_COLUMNS)
+    recommendations_df.to_csv('recommended_sites.csv', index=False)
+
+    print(f"Demand: {total_demand:.1f} customers at {len(weights)} unique locations")
+    print(f"Candidates: {len(candidates_df)} inactive clinics ({coverage.nnz} coverage links)")
+    for row in rows:
+        print(f"{row['rank']:>2}. {row['name']} ({row['postcode']}): +{row['marginal_gain']:.1f} customers "
+              f"({row['cumulative_share']:.1%} of demand covered)")
+    print("\nSaved recommended_sites.csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import mapbox_vector_tile
+from assignment_index import REGIONS_FILE, CUSTOMERS_FILE, file_fingerprint
+from region_day_counts import get_count_cube, window_counts
+from region_layer import create_color_scale, region_status
+from region_lod import get_region_lod, lod_zoom_for
+
+TILE_CACHE_DIR = 'tile_cache'
+LAYER_NAME = 'regions'
+TILE_EXTENT = 4096
+TILE_BUFFER = 1 / 16  # fraction of a tile drawn past each edge so outlines meet across tiles
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+
+# /regions/<start>/<end>/<z>/<x>/<y>.pbf
+TILE_PATH = re.compile(r'^/regions/(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})/(\d+)/(\d+)/(\d+)\.pbf$')
+
+def tile_bounds(z, x, y):
+    """Web Mercator (EPSG:3857) bounds of a slippy-map tile."""
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** z
+    minx = -WEB_MERCATOR_HALF_WORLD + x * size
+    maxy = WEB_MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def data_version(regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """Short hash of the input file fingerprints, used to separate cached tiles by data version."""
+    fingerprints = [file_fingerprint(regions_path), file_fingerprint(customers_path)]
+    return hashlib.sha1(json.dumps(fingerprints).encode()).hexdigest()[:12]
+
+def load_tile_data(regions_path=REGIONS_FILE, customers_path=CUSTOMERS_FILE):
+    """
+    Load the regions, count cube and level-of-detail geometries, projected to
+    Web Mercator with an R-tree per level.
+
+    Returns:
+        dict: version, region_id, hours, cube, levels (zoom -> geometries; None is
+        full detail) and trees (zoom -> STRtree)
+    """
+    regions_gdf = gpd.read_file(regions_path)
+    lod = get_region_lod(regions_gdf, regions_path)
+
+    levels = {None: np.asarray(regions_gdf.geometry.values)}
+    levels.update(lod)
+    levels = {zoom: gpd.GeoSeries(geometries, crs=regions_gdf.crs).to_crs(3857).values
+              for zoom, geometries in levels.items()}
+
+    return {
+        'version': data_version(regions_path, customers_path),
+        'region_id': regions_gdf['region_id'].to_numpy(),
+        'hours': regions_gdf['total_availability_hours'].to_numpy(dtype=float),
+        'cube': get_count_cube(regions_gdf, regions_path=regions_path, customers_path=customers_path),
+        'lod': lod,
+        'levels': levels,
+        'trees': {zoom: shapely.STRtree(np.asarray(geometries)) for zoom, geometries in levels.items()}
+    }
+
+def window_attributes(data, start_date, end_date):
+    """
+    Per-region customer count, capacity ratio, status and fill colour for a window,
+    computed as visualize_regions.py does from the count cube.
+
+    Counts are raw appointments per region, which equal visualize_regions.py's
+    de-duplicated counts only when every customer ID appears once; the app disables
+    the tile layer otherwise, and while HyperLogLog counting is on.
+    """
+    customer_counts, _ = window_counts(data['cube'], start_date, end_date)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = customer_counts / data['hours']
+    ratio = np.nan_to_num(ratio, nan=0.0, posinf=np.inf)
+
+    status = region_status(ratio)
+    color_scale = create_color_scale()
+    fill_color = [color_scale(r) if np.isfinite(r) else 'gray' for r in ratio]
+    return pd.DataFrame({
+        'region_id': data['region_id'],
+        'customer_count': customer_counts,
+        'capacity_ratio': np.where(np.isfinite(ratio), np.round(ratio, 3), -1.0),
+        'weekly_hours': np.round(data['hours'], 1),
+        'status': status,
+        'fill_color': fill_color
+    })
+
+def render_tile(data, attributes, z, x, y):
+    """Encode the regions intersecting a tile, clipped to it, as a Mapbox Vector Tile."""
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    pad = (maxx - minx) * TILE_BUFFER
+    level = lod_zoom_for(data['lod'], z)
+    geometries = data['levels'][level]
+
+    region_positions = data['trees'][level].query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))
+    clipped = shapely.clip_by_rect(geometries[region_positions], minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    features = []
+    for position, geometry in zip(region_positions, clipped):
+        if geometry.is_empty:
+            continue
+        properties = attributes.iloc[position].to_dict()
+        features.append({
+            'geometry': geometry,
+            'properties': {key: value.item() if hasattr(value, 'item') else value for key, value in properties.items()},
+            'id': int(properties['region_id'])
+        })
+
+    return mapbox_vector_tile.encode(
+        [{'name': LAYER_NAME, 'features': features}],
+        default_options={'quantize_bounds': (minx, miny, maxx, maxy), 'extents': TILE_EXTENT}
+    )
+
+def get_tile(state, start_date, end_date, z, x, y):
+    """Return tile bytes from the on-disk cache, rendering and storing them on a miss."""
+    data = state['data']
+    tile_path = os.path.join(state['cache_dir'], data['version'], f"{start_date}_{end_date}",
+                             str(z), str(x), f"{y}.pbf")
+    if os.path.exists(tile_path):
+        with open(tile_path, 'rb') as f:
+            return f.read()
+
+    window = (start_date, end_date)
+    with state['lock']:
+        attributes = state['attributes'].get(window)
+        if attributes is None:
+            attributes = window_attributes(data, start_date, end_date)
+            state['attributes'][window] = attributes
+    tile = render_tile(data, attributes, z, x, y)
+
+    os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+    tmp_path = f"{tile_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(tile)
+    os.replace(tmp_path, tile_path)
+    return tile
+
+def refresh_state(state):
+    """Reload the data if regions.geojson or the customer file changed since it was loaded."""
+    version = data_version(state['regions_path'], state['customers_path'])
+    with state['lock']:
+        if state['data'] is None or state['data']['version'] != version:
+            state['data'] = load_tile_data(state['regions_path'], state['customers_path'])
+            state['attributes'] = {}
+
+def make_handler(state):
+    """Request handler serving /regions/<start>/<end>/<z>/<x>/<y>.pbf from the shared state."""
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = TILE_PATH.match(self.path.split('?')[0])
+            if not match:
+                self.send_error(404, 'Expected /regions/<start>/<end>/<z>/<x>/<y>.pbf')
+                return
+            start_date, end_date = match.group(1), match.group(2)
+            z, x, y = (int(value) for value in match.groups()[2:])
+            if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                self.send_error(404, 'Tile out of range')
+                return
+
+            refresh_state(state)
+            tile = get_tile(state, start_date, end_date, z, x, y)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.mapbox-vector-tile')
+            self.send_header('Content-Length', str(len(tile)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(tile)
+
+        def log_message(self, format, *args):
+            if state['verbose']:
+                super().log_message(format, *args)
+
+    return TileHandler
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve regions and capacity attributes as Mapbox Vector Tiles')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--regions', default=REGIONS_FILE, help='Regions GeoJSON file')
+    parser.add_argument('--customers', default=CUSTOMERS_FILE, help='Cleaned customers CSV file')
+    parser.add_argument('--cache_dir', default=TILE_CACHE_DIR, help='Directory for cached tiles')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    state = {
+        'regions_path': args.regions,
+        'customers_path': args.customers,
+        'cache_dir': args.cache_dir,
+        'verbose': args.verbose,
+        'lock': threading.Lock(),
+        'data': None,
+        'attributes': {}
+    }
+    refresh_state(state)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Serving {len(state['data']['region_id'])} regions at "
+          f"http://{args.host}:{args.port}/regions/<start>/<end>/{{z}}/{{x}}/{{y}}.pbf")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+if __name__ == "__main__":
+    main()
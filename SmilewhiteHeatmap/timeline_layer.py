@@ -0,0 +1,152 @@
+import json
+import numpy as np
+import shapely
+import geopandas as gpd
+from branca.element import MacroElement
+from jinja2 import Template
+from process_customers import calculate_capacity_timeseries
+from region_layer import COORDINATE_DECIMALS, STATUSES, create_color_scale, status_codes
+
+PALETTE_STEPS = 64  # colours sampled along the capacity scale; one more entry is gray for no availability
+FRAME_INTERVAL_MS = 800
+
+def build_timeline(regions_gdf, cube, geometry=None, window_days=7, color_scale=None, decimals=COORDINATE_DECIMALS):
+    """
+    Precompute every week's region colours and statuses in one pass over the count cube.
+
+    Geometry is stored once; each frame is only a row of small integers indexing the
+    shared colour palette and status labels. Counts are raw appointments from the cube,
+    not customers de-duplicated by ID.
+
+    Args:
+        regions_gdf (GeoDataFrame): Regions, in the order used to build the cube
+        cube (dict): Region × day count cube from region_day_counts.py
+        geometry (array): Geometries to draw (e.g. a level-of-detail level); defaults to regions_gdf's
+        window_days (int): Length of each frame in days
+        color_scale (LinearColormap): Colour scale for capacity ratios
+        decimals (int): Coordinate precision
+
+    Returns:
+        dict: features (GeoJSON FeatureCollection), frames (labels), palette, colors,
+        statuses, status and counts (frames × regions)
+    """
+    if color_scale is None:
+        color_scale = create_color_scale()
+    if geometry is None:
+        geometry = regions_gdf.geometry.values
+
+    timeseries_df = calculate_capacity_timeseries(regions_gdf, cube, window_days, window_days)
+    n_regions = len(regions_gdf)
+    # A cube without days still yields one empty period; show no frames instead
+    n_frames = len(timeseries_df) // max(n_regions, 1) if cube['cumulative'].shape[1] > 1 else 0
+    ratio = timeseries_df['capacity_ratio'].to_numpy().reshape(n_regions, -1).T[:n_frames]
+    counts = timeseries_df['customer_count'].to_numpy().reshape(n_regions, -1).T[:n_frames]
+    # Statuses follow the app: a region with neither hours nor customers has no customers
+    status = status_codes(np.where(counts == 0, 0.0, ratio))
+
+    palette = [color_scale(v) for v in np.linspace(color_scale.vmin, color_scale.vmax, PALETTE_STEPS)] + ['gray']
+    position = np.clip((ratio - color_scale.vmin) / (color_scale.vmax - color_scale.vmin), 0, 1)
+    colors = np.where(np.isinf(ratio), PALETTE_STEPS, np.rint(np.nan_to_num(position) * (PALETTE_STEPS - 1)))
+
+    features_gdf = gpd.GeoDataFrame(
+        {'i': np.arange(n_regions), 'region_id': regions_gdf['region_id'].to_numpy()},
+        geometry=shapely.transform(np.asarray(geometry), lambda coords: np.round(coords, decimals)),
+        crs=regions_gdf.crs
+    )
+    period_start = timeseries_df['period_start'].iloc[:n_frames]
+    return {
+        'features': features_gdf.to_geo_dict(drop_id=True),
+        'frames': [f"Week of {start:%Y-%m-%d}" for start in period_start],
+        'palette': palette,
+        'colors': colors.astype(int).tolist(),
+        'statuses': STATUSES,
+        'status': status.tolist(),
+        'counts': counts.astype(int).tolist()
+    }
+
+class TimelineLayer(MacroElement):
+    """
+    Regions drawn once as a GeoJSON layer, restyled client-side from precomputed
+    per-frame colours by a slider and play button.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var timeline = {{ this.timeline_json }};
+            if (timeline.frames.length === 0) {
+                return;
+            }
+            var frame = 0;
+            var layer = L.geoJson(timeline.features, {
+                style: function(feature) {
+                    return {
+                        fillColor: timeline.palette[timeline.colors[0][feature.properties.i]],
+                        color: 'black',
+                        weight: 1,
+                        fillOpacity: 0.7
+                    };
+                }
+            }).addTo(map);
+            layer.bindTooltip(function(region) {
+                var i = region.feature.properties.i;
+                return 'Region ' + region.feature.properties.region_id + ' - ' +
+                    timeline.statuses[timeline.status[frame][i]] + ' (' + timeline.counts[frame][i] + ' appointments)';
+            });
+
+            var control = L.control({position: 'bottomleft'});
+            var slider, label, button, timer = null;
+            function show(k) {
+                frame = k;
+                var colors = timeline.colors[k];
+                layer.eachLayer(function(region) {
+                    region.setStyle({fillColor: timeline.palette[colors[region.feature.properties.i]]});
+                });
+                slider.value = k;
+                label.innerHTML = timeline.frames[k];
+            }
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '6px';
+                button = L.DomUtil.create('button', '', div);
+                button.innerHTML = '&#9654;';
+                slider = L.DomUtil.create('input', '', div);
+                slider.type = 'range';
+                slider.min = 0;
+                slider.max = timeline.frames.length - 1;
+                slider.value = 0;
+                slider.style.width = '240px';
+                slider.style.verticalAlign = 'middle';
+                label = L.DomUtil.create('span', '', div);
+                label.style.marginLeft = '6px';
+                label.innerHTML = timeline.frames[0];
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.on(slider, 'input', function() { show(parseInt(slider.value)); });
+                L.DomEvent.on(button, 'click', function() {
+                    if (timer) {
+                        clearInterval(timer);
+                        timer = null;
+                        button.innerHTML = '&#9654;';
+                    } else {
+                        timer = setInterval(function() { show((frame + 1) % timeline.frames.length); },
+                                            {{ this.interval }});
+                        button.innerHTML = '&#10073;&#10073;';
+                    }
+                });
+                return div;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, timeline, interval=FRAME_INTERVAL_MS):
+        super().__init__()
+        self._name = 'TimelineLayer'
+        self.timeline_json = json.dumps(timeline, separators=(',', ':'))
+        self.interval = interval
+
+def add_timeline_layer(m, timeline, interval=FRAME_INTERVAL_MS):
+    """Add a precomputed weekly timeline to the map."""
+    TimelineLayer(timeline, interval).add_to(m)
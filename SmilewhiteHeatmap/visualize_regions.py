@@ -2,14 +2,35 @@ import streamlit as st
 import pandas as pd
 import geopandas as gpd
 import folium
-from folium.plugins import HeatMap
-from branca.colormap import LinearColormap
 import json
-from datetime import datetime, timedelta
-import numpy as np
-from process_customers import calculate_region_capacity
-from streamlit_folium import folium_static
-from shapely.geometry import Point
+import os
+from datetime import timedelta
+from assignment_index import (build_assignment_index, build_region_tree, count_by_region, file_fingerprint,
+                              get_assignment_index)
+from region_day_counts import get_count_cube, window_counts
+from accessibility import RASTER_FILE, RASTER_META_FILE, load_accessibility_raster, raster_bounds, raster_image
+from gap_hotspots import cluster_gap_hotspots
+from distinct_counts import get_distinct_sketch, window_distinct_counts
+from postcode_rollups import drill_down, get_postcode_rollup
+from region_layer import (DEFAULT_TILE_URL, add_region_layer, add_region_tile_layer, create_color_scale,
+                          region_status)
+from region_lod import geometry_for_zoom, get_region_lod, lod_zoom_for
+from timeline_layer import add_timeline_layer, build_timeline
+from metrics_cache import cache_stats, cached_call, create_cache, frames_nbytes
+from streamlit_folium import st_folium
+
+DATA_FILES = ['regions.geojson', 'regions.csv', 'customers_with_latlon_cleaned.csv']
+
+def data_version():
+    """Fingerprints (path, mtime, size) of the input files; cached data is reused until one changes."""
+    return tuple(tuple(file_fingerprint(path).values()) for path in DATA_FILES)
+
+def raster_version():
+    """Fingerprints of the accessibility raster files, or None if either is missing."""
+    paths = [RASTER_FILE, RASTER_META_FILE]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return tuple(tuple(file_fingerprint(path).values()) for path in paths)
 
 def load_data():
     """Load and prepare all necessary data."""
@@ -35,15 +56,6 @@ def load_data():
         st.error(f"Error loading data: {str(e)}")
         return None, None
 
-def create_color_scale():
-    """Create a color scale for capacity ratios."""
-    return LinearColormap(
-        colors=['green', 'yellow', 'red'],
-        vmin=0,
-        vmax=2,
-        caption='Capacity Ratio (Customers/Hour)'
-    )
-
 def create_popup_content(region_data):
     """Create HTML content for region popups."""
     return f"""
@@ -57,75 +69,132 @@ def create_popup_content(region_data):
         </div>
     """
 
-def find_service_gaps(customers_df, regions_gdf, start_date, end_date):
+def period_mask(customers_df, start_date, end_date):
+    """Boolean mask of customer rows assigned within the date range (inclusive)."""
+    dates = customers_df['assigned_date'].dt.date
+    return ((dates >= start_date) & (dates <= end_date)).to_numpy()
+
+def find_service_gaps(customers_df, regions_gdf, start_date, end_date, index=None):
     """Find customers not served by any region."""
-    # Filter customers for the selected date range
-    mask = (customers_df['assigned_date'].dt.date >= start_date) & (customers_df['assigned_date'].dt.date <= end_date)
-    period_customers = customers_df[mask].copy()
-    
-    # Create points for each customer
-    customer_points = [Point(row['longitude'], row['latitude']) for _, row in period_customers.iterrows()]
+    if index is None:
+        index = build_assignment_index(regions_gdf, customers_df)
     
-    # Check each customer against all regions
-    gaps = []
-    for i, (point, row) in enumerate(zip(customer_points, period_customers.iterrows())):
-        is_in_region = False
-        for _, region in regions_gdf.iterrows():
-            if region.geometry.contains(point):
-                is_in_region = True
-                break
-        if not is_in_region:
-            gaps.append(row[1])  # row[1] contains the actual data
+    # Filter customers for the selected date range and look up their precomputed regions
+    _, gap_rows = count_by_region(index, period_mask(customers_df, start_date, end_date))
     
-    if gaps:
-        return pd.DataFrame(gaps)
+    if len(gap_rows):
+        return customers_df.iloc[gap_rows]
     return pd.DataFrame()
 
-def calculate_metrics(regions_gdf, customers_df, start_date, end_date):
-    """Calculate metrics for regions including customer counts and capacity ratios."""
-    # Filter customers for the selected date range and group by customer ID
-    mask = (customers_df['assigned_date'].dt.date >= start_date) & (customers_df['assigned_date'].dt.date <= end_date)
-    period_customers = customers_df[mask].copy()
+def calculate_metrics(regions_gdf, customers_df, start_date, end_date, index=None, cube=None, sketch=None):
+    """
+    Calculate metrics for regions including customer counts and capacity ratios.
     
-    # Group by customer ID to avoid counting the same customer multiple times
-    period_customers = period_customers.drop_duplicates(subset=['customer_id'])
+    When every customer ID appears once, de-duplication is a no-op and counts are
+    read straight from the region × day count cube if one is given. With HyperLogLog
+    sketches from distinct_counts.py, counts are approximate distinct customers per region.
+    """
+    if index is None:
+        index = build_assignment_index(regions_gdf, customers_df)
     
     # Create a copy of regions_gdf for metrics
     metrics_gdf = regions_gdf.copy()
     
-    # Initialize customer counts
-    metrics_gdf['customer_count'] = 0
-    
-    # Count unique customers per region
-    for idx, region in metrics_gdf.iterrows():
-        region_poly = region.geometry
-        region_customers = period_customers[period_customers.apply(
-            lambda row: region_poly.contains(Point(row['longitude'], row['latitude'])), axis=1
-        )]
-        metrics_gdf.at[idx, 'customer_count'] = len(region_customers)
+    if sketch is not None:
+        customer_counts, _ = window_distinct_counts(sketch, start_date, end_date)
+    elif cube is not None and customers_df['customer_id'].is_unique:
+        customer_counts, _ = window_counts(cube, start_date, end_date)
+    else:
+        # Filter customers for the selected date range
+        mask = period_mask(customers_df, start_date, end_date)
+        
+        # Keep one row per customer ID to avoid counting the same customer multiple times
+        unique_mask = mask.copy()
+        unique_mask[mask] = ~customers_df.loc[mask, 'customer_id'].duplicated().to_numpy()
+        
+        # Count unique customers per region from the assignment index
+        customer_counts, _ = count_by_region(index, unique_mask)
+    metrics_gdf['customer_count'] = customer_counts
     
     # Calculate capacity ratio (customers per hour)
     metrics_gdf['capacity_ratio'] = metrics_gdf['customer_count'] / metrics_gdf['total_availability_hours']
     metrics_gdf['capacity_ratio'] = metrics_gdf['capacity_ratio'].fillna(0)
     
     # Determine status based on capacity ratio
-    def get_status(ratio):
-        if ratio == 0:
-            return "No customers"
-        elif ratio < 0.5:
-            return "Under capacity"
-        elif ratio < 1:
-            return "Optimal capacity"
-        else:
-            return "Over capacity"
-    
-    metrics_gdf['status'] = metrics_gdf['capacity_ratio'].apply(get_status)
+    metrics_gdf['status'] = region_status(metrics_gdf['capacity_ratio'])
     
     # Find service gaps
-    gaps_df = find_service_gaps(customers_df, regions_gdf, start_date, end_date)
+    gaps_df = find_service_gaps(customers_df, regions_gdf, start_date, end_date, index)
     
     return metrics_gdf, gaps_df
 
+@st.cache_resource(show_spinner=False)
+def get_app_data(version):
+    """
+    Load the inputs and build the derived structures once per data version.
+    
+    Cached as a resource, so all sessions share the same objects; they must be
+    treated as read-only.
+    
+    Returns:
+        dict or None: regions_gdf, customers_df (dates parsed), min_date, max_date,
+        unique_ids (each customer ID appears once), tree (region STRtree), index, cube
+        and lod (simplified geometries per zoom); None if loading failed
+    """
+    regions_gdf, customers_df = load_data()
+    if regions_gdf is None or customers_df is None:
+        return None
+    
+    tree = build_region_tree(regions_gdf)
+    index = get_assignment_index(regions_gdf, customers_df, tree=tree)
+    return {
+        'regions_gdf': regions_gdf,
+        'customers_df': customers_df,
+        'min_date': customers_df['assigned_date'].dt.date.min(),
+        'max_date': customers_df['assigned_date'].dt.date.max(),
+        'unique_ids': customers_df['customer_id'].is_unique,
+        'tree': tree,
+        'index': index,
+        'cube': get_count_cube(regions_gdf, customers_df, index),
+        'lod': get_region_lod(regions_gdf)
+    }
+
+@st.cache_resource(show_spinner=False)
+def get_cached_sketch(version, error, _data):
+    """Distinct-customer sketches for the data version and error bound."""
+    return get_distinct_sketch(_data['regions_gdf'], _data['customers_df'], _data['index'], error)
+
+@st.cache_resource(show_spinner=False)
+def get_cached_rollup(version, _data):
+    """Postcode roll-up for the data version."""
+    return get_postcode_rollup(_data['regions_gdf'], _data['customers_df'], _data['index'])
+
+@st.cache_resource
+def get_metrics_cache():
+    """LRU cache of computed window metrics, shared by all sessions."""
+    return create_cache()
+
+@st.cache_data(show_spinner=False)
+def get_gap_hotspots(version, start_date, end_date, _gaps_df):
+    """Cluster the window's service gaps, cached per data version and date window."""
+    return cluster_gap_hotspots(_gaps_df)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_accessibility_overlay(version):
+    """Accessibility raster as (RGBA image, bounds) for the raster version; None if there is none."""
+    if version is None:
+        return None
+    grid, meta = load_accessibility_raster()
+    if grid is None:
+        return None
+    return raster_image(grid), raster_bounds(meta)
+
+@st.cache_data(show_spinner=False)
+def get_timeline(version, _data):
+    """Every week's region colours and statuses, computed once per data version."""
+    geometry = geometry_for_zoom(_data['lod'], _data['regions_gdf'], 8)
+    return build_timeline(_data['regions_gdf'], _data['cube'], geometry)
+
 def main():
     st.set_page_config(layout="wide", page_title="UK Dental Capacity Map")
     st.title("UK Dental Capacity Map")
@@ -134,15 +203,17 @@ def main():
     if 'date_selected' not in st.session_state:
         st.session_state.date_selected = False
     
-    # Load data for date range selection
+    # Load data (parsed once per version of the input files and shared by all sessions)
     try:
-        customers_df = pd.read_csv('customers_with_latlon_cleaned.csv', low_memory=False)
-        customers_df['assigned_date'] = pd.to_datetime(customers_df['assigned_date'])
-        min_date = customers_df['assigned_date'].dt.date.min()
-        max_date = customers_df['assigned_date'].dt.date.max()
-    except Exception:
+        version = data_version()
+    except OSError:
         st.error("Error loading customer data. Please check if the file exists.")
         return
+    data = get_app_data(version)
+    if data is None:
+        get_app_data.clear()
+        return
+    min_date, max_date = data['min_date'], data['max_date']
     
     # Date range selection in sidebar
     st.sidebar.header("Date Selection")
@@ -164,12 +235,65 @@ def main():
         max_value=max_end_date
     )
     
+    # Optional approximate distinct counting, consistent with process_customers.py --distinct
+    use_sketch = st.sidebar.checkbox(
+        "Approximate distinct customers (HyperLogLog)",
+        help="Count distinct customers per region from mergeable day sketches instead of de-duplicating rows"
+    )
+    sketch_error = st.sidebar.select_slider(
+        "Target error",
+        options=[0.04, 0.05, 0.1],
+        value=0.05,
+        format_func=lambda e: f"{e:.0%}",
+        disabled=not use_sketch
+    )
+    
+    # Optional vector tiles from a local tile_server.py process, for national-scale region sets.
+    # The tile server colours regions from raw cube counts, which only match calculate_metrics
+    # when no customer ID repeats and HyperLogLog counting is off.
+    tiles_available = data['unique_ids'] and not use_sketch
+    use_tiles = st.sidebar.checkbox(
+        "Draw regions from local tile server",
+        help="Run `python tile_server.py` first; the map then only downloads the region tiles in view",
+        disabled=not tiles_available
+    ) and tiles_available
+    if not tiles_available:
+        st.sidebar.caption(
+            "Tile server unavailable: it counts raw appointments, so it cannot show "
+            + ("HyperLogLog distinct counts." if use_sketch else "customers de-duplicated by ID.")
+        )
+    tile_url = st.sidebar.text_input("Tile server URL", value=DEFAULT_TILE_URL, disabled=not use_tiles)
+    
+    # Optional two-step floating catchment accessibility raster written by accessibility.py
+    access_overlay = get_accessibility_overlay(raster_version())
+    show_access = st.sidebar.checkbox(
+        "Accessibility overlay (2SFCA)",
+        help="Clinic hours within reach per customer; run `python accessibility.py` to create or refresh it",
+        disabled=access_overlay is None
+    ) and access_overlay is not None
+    
     # Add a button to trigger visualization
     if st.sidebar.button("Generate Visualization"):
         st.session_state.date_selected = True
         st.session_state.start_date = start_date
         st.session_state.end_date = end_date
     
+    # Weekly timeline: all weeks precomputed, scrubbed in the browser without reruns
+    if st.sidebar.checkbox("Weekly capacity timeline", help="Play or scrub capacity week by week across all data"):
+        st.write("### Weekly Capacity Timeline")
+        with st.spinner("Precomputing weekly capacity..."):
+            timeline = get_timeline(version, data)
+        if timeline['frames']:
+            timeline_map = folium.Map(location=[54.5, -2], zoom_start=6)
+            create_color_scale().add_to(timeline_map)
+            add_timeline_layer(timeline_map, timeline)
+            st_folium(timeline_map, width=800, returned_objects=[], key='timeline_map')
+            st.caption(f"{len(timeline['frames'])} weeks, {timeline['frames'][0][8:]} to {timeline['frames'][-1][8:]}; "
+                       "counts are raw appointments (not de-duplicated by customer ID); "
+                       "gray regions have no availability")
+        else:
+            st.info("No customer data to show in the timeline.")
+    
     # Show instructions if dates haven't been selected
     if not st.session_state.date_selected:
         st.info("Please select a date range (maximum 7 days) in the sidebar and click 'Generate Visualization' to view the map.")
@@ -177,55 +301,88 @@ def main():
     
     # Show loading message
     with st.spinner("Calculating metrics and generating visualization..."):
-        # Load data
-        regions_gdf, customers_df = load_data()
-        if regions_gdf is None or customers_df is None:
-            return
+        regions_gdf, customers_df = data['regions_gdf'], data['customers_df']
+        index, cube = data['index'], data['cube']
+        sketch = get_cached_sketch(version, sketch_error, data) if use_sketch else None
         
-        # Calculate metrics for the selected date range
-        metrics_gdf, gaps_df = calculate_metrics(
-            regions_gdf,
-            customers_df,
+        # Calculate metrics for the selected date range (reused if this window was seen before)
+        metrics_cache = get_metrics_cache()
+        metrics_key = (
+            version,
             st.session_state.start_date,
-            st.session_state.end_date
+            st.session_state.end_date,
+            sketch_error if use_sketch else None
+        )
+        metrics_gdf, gaps_df = cached_call(
+            metrics_cache,
+            metrics_key,
+            lambda: calculate_metrics(
+                regions_gdf,
+                customers_df,
+                st.session_state.start_date,
+                st.session_state.end_date,
+                index,
+                cube,
+                sketch
+            ),
+            lambda result: frames_nbytes(*result)
         )
         
-        # Create map
-        m = folium.Map(location=[54.5, -2], zoom_start=6)
+        with st.sidebar.expander("Debug"):
+            stats = cache_stats(metrics_cache)
+            st.write(f"Metrics cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
+            st.write(f"{stats['entries']} windows cached, "
+                     f"{stats['bytes'] / 1e6:.1f} of {stats['max_bytes'] / 1e6:.0f} MB")
+        
+        # Create map at the zoom and centre the user last viewed
+        map_zoom = st.session_state.get('map_zoom', 6)
+        map_center = st.session_state.get('map_center', [54.5, -2])
+        m = folium.Map(location=map_center, zoom_start=map_zoom)
         
         # Add regions with color based on capacity ratio
         color_scale = create_color_scale()
         color_scale.add_to(m)
         
-        for idx, row in metrics_gdf.iterrows():
-            # Create popup content
-            popup_content = create_popup_content(row)
-            
-            # Determine fill color based on capacity ratio
-            fill_color = color_scale(row['capacity_ratio']) if row['capacity_ratio'] != float('inf') else 'gray'
-            
-            # Add region to map with both popup and tooltip
-            folium.GeoJson(
-                row.geometry,
-                style_function=lambda x, color=fill_color: {
-                    'fillColor': color,
-                    'color': 'black',
-                    'weight': 1,
-                    'fillOpacity': 0.7
-                },
-                popup=folium.Popup(popup_content, max_width=300),
-                tooltip=f"Region {row['region_id']} - {row['status']}"
+        if use_tiles:
+            # Regions arrive as vector tiles cut by the tile server for this window
+            add_region_tile_layer(m, st.session_state.start_date, st.session_state.end_date, tile_url)
+        else:
+            # Draw the region geometries simplified for the current zoom
+            lod_geometry = geometry_for_zoom(data['lod'], regions_gdf, map_zoom)
+            add_region_layer(m, metrics_gdf.set_geometry(lod_geometry, crs=metrics_gdf.crs), color_scale)
+        
+        if show_access:
+            folium.raster_layers.ImageOverlay(
+                access_overlay[0],
+                bounds=access_overlay[1],
+                origin='lower',
+                mercator_project=True,
+                pixelated=False,
+                name='Accessibility'
             ).add_to(m)
         
-        # Add gap points as a heatmap
-        if not gaps_df.empty:
-            gap_points = gaps_df[['latitude', 'longitude']].values.tolist()
-            HeatMap(
-                gap_points,
-                radius=15,
-                blur=10,
-                max_zoom=1,
-                gradient={0.4: 'blue', 0.65: 'lime', 1: 'red'}
+        # Add service gap hotspots
+        hotspots_df = get_gap_hotspots(
+            version,
+            st.session_state.start_date,
+            st.session_state.end_date,
+            gaps_df
+        )
+        for _, hotspot in hotspots_df.iterrows():
+            folium.Circle(
+                location=[hotspot['latitude'], hotspot['longitude']],
+                radius=max(hotspot['radius_km'], 1.0) * 1000,
+                color='purple',
+                weight=2,
+                fill=True,
+                fill_opacity=0.3,
+                popup=folium.Popup(
+                    f"<b>{hotspot['customer_count']} unserved customers</b><br>"
+                    f"Radius: {hotspot['radius_km']:.1f} km<br>"
+                    f"Top postcodes: {hotspot['top_postcodes']}",
+                    max_width=300
+                ),
+                tooltip=f"Gap hotspot - {hotspot['customer_count']} customers"
             ).add_to(m)
         
         # Create two columns for the map and legend
@@ -233,7 +390,25 @@ def main():
         
         with col1:
             # Display map
-            folium_static(m, width=800)
+            map_state = st_folium(
+                m,
+                width=800,
+                zoom=map_zoom,
+                center=map_center,
+                returned_objects=['zoom', 'center'],
+                key='region_map'
+            )
+            
+            # Redraw with another level of detail only once the zoom crosses a pyramid level,
+            # keeping the view where the user left it
+            new_zoom = (map_state or {}).get('zoom')
+            if not use_tiles and new_zoom is not None and \
+                    lod_zoom_for(data['lod'], new_zoom) != lod_zoom_for(data['lod'], map_zoom):
+                st.session_state.map_zoom = new_zoom
+                new_center = map_state.get('center') or {}
+                if new_center.get('lat') is not None and new_center.get('lng') is not None:
+                    st.session_state.map_center = [new_center['lat'], new_center['lng']]
+                st.rerun()
         
         with col2:
             # Display color scale legend
@@ -244,8 +419,11 @@ def main():
             st.markdown("Red: High utilization")
             st.markdown("Gray: No availability")
             st.write("---")
-            st.write("Heatmap (Blue-Green-Red):")
-            st.markdown("Shows concentration of service gaps")
+            st.write("Purple circles:")
+            st.markdown("Clusters of service gaps (click for size and top postcodes)")
+            if show_access:
+                st.write("Accessibility overlay:")
+                st.markdown("Red to green: poor to good access to clinic hours (2SFCA)")
         
         # Display summary statistics
         st.write("### Summary Statistics")
@@ -282,6 +460,13 @@ def main():
             st.write("### Service Gaps")
             st.write("Areas not serviced by any clinic:")
             
+            if not hotspots_df.empty:
+                st.write("#### Gap Hotspots")
+                hotspot_display = hotspots_df.drop(columns='hotspot_id').copy()
+                hotspot_display[['latitude', 'longitude']] = hotspot_display[['latitude', 'longitude']].round(4)
+                hotspot_display['radius_km'] = hotspot_display['radius_km'].round(1)
+                st.dataframe(hotspot_display)
+            
             if 'postal_code' in gaps_df.columns:
                 st.write("#### Gaps by Postal Code")
                 gaps_by_postcode = gaps_df.groupby('postal_code').size().reset_index(name='count')
@@ -301,6 +486,23 @@ def main():
             overcrowded_display['total_availability_hours'] = overcrowded_display['total_availability_hours'].round(1)
             overcrowded_display['capacity_ratio'] = overcrowded_display['capacity_ratio'].round(2)
             st.dataframe(overcrowded_display)
+        
+        # Drill down from postcode areas to districts and sectors
+        with st.expander("Demand by Postcode"):
+            rollup = get_cached_rollup(version, data)
+            start, end = st.session_state.start_date, st.session_state.end_date
+            
+            areas = drill_down(rollup, start, end)
+            area = st.selectbox("Postcode area", ["All areas"] + areas['key'].tolist())
+            if area == "All areas":
+                st.dataframe(areas)
+            else:
+                districts = drill_down(rollup, start, end, area, 'area')
+                district = st.selectbox("Postcode district", ["All districts"] + districts['key'].tolist())
+                if district == "All districts":
+                    st.dataframe(districts)
+                else:
+                    st.dataframe(drill_down(rollup, start, end, district, 'district'))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+def load_active_clinics(clinics_path='dentist_data_map.csv'):
+    """Load active clinics with valid coordinates; missing availability counts as 0 hours."""
+    df = pd.read_csv(clinics_path)
+    df = df[df['active'] == 1].dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    df['weekly_availability_hours'] = pd.to_numeric(df['weekly_availability_hours'], errors='coerce').fillna(0.0)
+    return df
+
+def get_clinic_tree(clinics_path='dentist_data_map.csv', cache_path='clinic_balltree.pkl'):
+    """
+    Return a haversine BallTree over the active clinics, cached on disk.
+
+    The cache is rebuilt whenever the clinics file's mtime or size changes.
+
+    Returns:
+        dict: tree (None if there are no active clinics), plus clinic_id, name,
+        weekly_availability_hours, latitude and longitude arrays in tree order
+    """
+    stat = os.stat(clinics_path)
+    version = (os.path.abspath(clinics_path), stat.st_mtime_ns, stat.st_size)
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('version') == version:
+            return cached
+
+    clinics = load_active_clinics(clinics_path)
+    cached = {
+        'version': version,
+        'tree': BallTree(np.radians(clinics[['latitude', 'longitude']].to_numpy()), metric='haversine') if len(clinics) else None,
+        'clinic_id': clinics['id'].to_numpy(),
+        'name': clinics['name'].to_numpy(),
+        'weekly_availability_hours': clinics['weekly_availability_hours'].to_numpy(dtype=float),
+        'latitude': clinics['latitude'].to_numpy(dtype=float),
+        'longitude': clinics['longitude'].to_numpy(dtype=float)
+    }
+    with open(cache_path, 'wb') as f:
+        pickle.dump(cached, f)
+    return cached
+
+def unique_query_points(latitudes, longitudes):
+    """
+    De-duplicate query coordinates (customers share postcode centroids).
+
+    Returns:
+        tuple: (codes, unique_points_in_radians) where query i uses unique point codes[i]
+    """
+    coords = pd.DataFrame({'lat': np.asarray(latitudes, dtype=float), 'lon': np.asarray(longitudes, dtype=float)})
+    codes = coords.groupby(['lat', 'lon'], sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    return codes, np.radians(coords.to_numpy()[first_rows])
+
+def knn_query(clinics, latitudes, longitudes, k=5, rank_by='distance'):
+    """
+    Find the k nearest active clinics to each point.
+
+    Args:
+        clinics (dict): From get_clinic_tree
+        latitudes, longitudes (array-like): Query points; must not contain NaN
+        k (int): Number of clinics per point (capped at the number of clinics)
+        rank_by (str): 'distance', or 'hours' to order each point's k clinics by
+            available hours (most first), then distance
+
+    Returns:
+        tuple: (clinic_ids, distances_km, hours), each of shape (n_points, k)
+    """
+    k = max(min(k, len(clinics['clinic_id'])), 0)
+    n_points = len(latitudes)
+    if k == 0 or n_points == 0:
+        # No clinics (or no points) to match: empty results of the usual shape
+        empty = np.empty((n_points, k))
+        return np.empty((n_points, k), dtype=clinics['clinic_id'].dtype), empty, empty.copy()
+    codes, points = unique_query_points(latitudes, longitudes)
+    distances, indices = clinics['tree'].query(points, k=k)
+    distances, indices = distances[codes] * EARTH_RADIUS_KM, indices[codes]
+
+    hours = clinics['weekly_availability_hours'][indices]
+    if rank_by == 'hours':
+        order = np.lexsort((distances, -hours), axis=-1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        hours = np.take_along_axis(hours, order, axis=1)
+
+    return clinics['clinic_id'][indices], distances, hours
+
+def radius_query(clinics, latitudes, longitudes, radius_km, rank_by='distance'):
+    """
+    Find every active clinic within radius_km of each point.
+
+    Results are flat arrays grouped by point: the clinics of point i are at
+    positions offsets[i]:offsets[i + 1].
+
+    Returns:
+        tuple: (offsets, clinic_ids, distances_km, hours)
+    """
+    if clinics['tree'] is None or len(latitudes) == 0:
+        empty = np.array([], dtype=np.int64)
+        return (np.zeros(len(latitudes) + 1, dtype=np.int64), clinics['clinic_id'][empty],
+                np.array([]), np.array([]))
+
+    codes, points = unique_query_points(latitudes, longitudes)
+    indices, distances = clinics['tree'].query_radius(points, r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+
+    # Expand the per-unique-point results to every query point
+    counts = np.array([len(idx) for idx in indices], dtype=np.int64)
+    unique_offsets = np.concatenate([[0], np.cumsum(counts)])
+    flat_indices = np.concatenate(indices) if len(indices) else np.array([], dtype=np.int64)
+    flat_distances = np.concatenate(distances) * EARTH_RADIUS_KM if len(distances) else np.array([])
+
+    per_point = counts[codes]
+    offsets = np.concatenate([[0], np.cumsum(per_point)])
+    point = np.repeat(np.arange(len(codes)), per_point)
+    source = np.repeat(unique_offsets[codes], per_point) + (np.arange(offsets[-1]) - np.repeat(offsets[:-1], per_point))
+    result_indices = flat_indices[source].astype(np.int64)
+    result_distances = flat_distances[source]
+    result_hours = clinics['weekly_availability_hours'][result_indices]
+
+    # Sort within each point's group
+    if rank_by == 'hours':
+        order = np.lexsort((result_distances, -result_hours, point))
+    else:
+        order = np.lexsort((result_distances, point))
+    return offsets, clinics['clinic_id'][result_indices[order]], result_distances[order], result_hours[order]
+
+def main():
+    parser = argparse.ArgumentParser(description='Find active clinics near customers')
+    parser.add_argument('customers', help='CSV file with latitude and longitude columns')
+    parser.add_argument('--clinics', default='dentist_data_map.csv', help='Clinic data file')
+    parser.add_argument('--k', type=int, default=5, help='Number of nearest clinics per customer')
+    parser.add_argument('--radius_km', type=float, help='Return all clinics within this distance instead of the k nearest')
+    parser.add_argument('--rank_by', choices=['distance', 'hours'], default='distance', help='Ordering of each customer\'s clinics')
+    parser.add_argument('--output', default='clinic_matches.csv', help='Output CSV file')
+    args = parser.parse_args()
+
+    customers_df = pd.read_csv(args.customers, low_memory=False)
+    customers_df = customers_df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    clinics = get_clinic_tree(args.clinics)
+
+    if args.radius_km is not None:
+        offsets, clinic_ids, distances, hours = radius_query(
+            clinics, customers_df['latitude'], customers_df['longitude'], args.radius_km, args.rank_by
+        )
+        counts = np.diff(offsets)
+        rows = np.repeat(np.arange(len(customers_df)), counts)
+        ranks = np.arange(len(rows)) - np.repeat(offsets[:-1], counts) + 1
+    else:
+        clinic_ids, distances, hours = knn_query(
+            clinics, customers_df['latitude'], customers_df['longitude'], args.k, args.rank_by
+        )
+        rows = np.repeat(np.arange(len(customers_df)), clinic_ids.shape[1])
+        ranks = np.tile(np.arange(1, clinic_ids.shape[1] + 1), len(customers_df))
+        clinic_ids, distances, hours = clinic_ids.ravel(), distances.ravel(), hours.ravel()
+
+    results = pd.DataFrame({
+        'customer_row': rows,
+        'rank': ranks,
+        'clinic_id': clinic_ids,
+        'distance_km': distances.round(3),
+        'weekly_availability_hours': hours
+    })
+    if 'customer_id' in customers_df.columns:
+        results.insert(1, 'customer_id', customers_df['customer_id'].to_numpy()[rows])
+    results.to_csv(args.output, index=False)
+
+    print(f"Matched {len(customers_df)} customers against {len(clinics['clinic_id'])} active clinics")
+    print(f"Saved {len(results)} matches to {args.output}")
+
+if __name__ == "__main__":
+    main()
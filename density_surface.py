@@ -0,0 +1,228 @@
+import os
+import json
+import hashlib
+import numpy as np
+from pyproj import Transformer
+from scipy.signal import fftconvolve
+from branca.utilities import write_png
+
+GRID_CRS = 'EPSG:27700'  # British National Grid, metres
+UK_EXTENT = (-100000, 0, 700000, 1250000)  # minx, miny, maxx, maxy in GRID_CRS
+DEFAULT_CELL_KM = 2.0
+DEFAULT_BANDWIDTH_KM = 10.0
+KERNEL_SIGMAS = 4  # kernel is truncated this many bandwidths from its centre
+DENSITY_CACHE_DIR = 'density_cache'
+MAX_CACHED_PER_KIND = 8  # most recently used surfaces of each kind kept on disk
+
+SUPPLY_COLORS = ['#f7fbff', '#6baed6', '#08306b']
+DEMAND_COLORS = ['#fff5eb', '#fd8d3c', '#7f2704']
+RATIO_COLORS = ['#d73027', '#ffffbf', '#1a9850']  # undersupplied -> balanced -> well supplied
+
+_TO_GRID = Transformer.from_crs('EPSG:4326', GRID_CRS, always_xy=True)
+_MERCATOR_TO_GRID = Transformer.from_crs('EPSG:3857', GRID_CRS, always_xy=True)
+_GRID_TO_LATLON = Transformer.from_crs(GRID_CRS, 'EPSG:4326', always_xy=True)
+_LATLON_TO_MERCATOR = Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+
+def grid_shape(extent=UK_EXTENT, cell_km=DEFAULT_CELL_KM):
+    """(rows, columns) of the grid covering an extent."""
+    minx, miny, maxx, maxy = extent
+    cell = cell_km * 1000
+    return int(np.ceil((maxy - miny) / cell)), int(np.ceil((maxx - minx) / cell))
+
+def grid_points(latitudes, longitudes, weights=None, extent=UK_EXTENT, cell_km=DEFAULT_CELL_KM):
+    """
+    Sum point weights into grid cells in projected coordinates.
+
+    Returns:
+        ndarray: (rows, columns) weight totals; row 0 is the southern edge
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    weights = np.ones(len(latitudes)) if weights is None else np.asarray(weights, dtype=float)
+    valid = np.isfinite(latitudes) & np.isfinite(longitudes) & np.isfinite(weights)
+
+    x, y = _TO_GRID.transform(longitudes[valid], latitudes[valid])
+    minx, miny, maxx, maxy = extent
+    rows, cols = grid_shape(extent, cell_km)
+    cell = cell_km * 1000
+    grid, _, _ = np.histogram2d(
+        y, x,
+        bins=[rows, cols],
+        range=[[miny, miny + rows * cell], [minx, minx + cols * cell]],
+        weights=weights[valid]
+    )
+    return grid
+
+def gaussian_kernel(bandwidth_km, cell_km=DEFAULT_CELL_KM):
+    """Normalised 2-D Gaussian kernel with standard deviation bandwidth_km, sampled on the grid."""
+    sigma = bandwidth_km / cell_km
+    radius = max(int(np.ceil(KERNEL_SIGMAS * sigma)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    profile = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel = np.outer(profile, profile)
+    return kernel / kernel.sum()
+
+def kde_surface(latitudes, longitudes, weights=None, bandwidth_km=DEFAULT_BANDWIDTH_KM,
+                cell_km=DEFAULT_CELL_KM, extent=UK_EXTENT):
+    """
+    Gaussian kernel density of weighted points, computed by FFT convolution of the
+    gridded weights.
+
+    Args:
+        latitudes, longitudes (array-like): Point coordinates
+        weights (array-like): Point weights (e.g. weekly hours); each point counts 1 if None
+        bandwidth_km (float): Kernel standard deviation in kilometres
+        cell_km (float): Grid cell size in kilometres
+        extent (tuple): Grid extent in GRID_CRS
+
+    Returns:
+        dict: density (weight per km², row 0 south), extent, cell_km, bandwidth_km and total weight
+    """
+    grid = grid_points(latitudes, longitudes, weights, extent, cell_km)
+    density = fftconvolve(grid, gaussian_kernel(bandwidth_km, cell_km), mode='same') / cell_km ** 2
+    return {
+        'density': np.clip(density, 0, None),  # FFT round-off leaves tiny negatives
+        'extent': tuple(extent),
+        'cell_km': cell_km,
+        'bandwidth_km': bandwidth_km,
+        'total': float(grid.sum())
+    }
+
+def ratio_surface(supply, demand, min_share=0.01):
+    """
+    Supply per unit of demand on a shared grid, e.g. weekly clinic hours per appointment.
+
+    Cells with less than min_share of the peak demand are left empty (NaN) rather than
+    dividing by almost nothing.
+    """
+    demand_density = demand['density']
+    covered = (demand_density > 0) & (demand_density >= min_share * demand_density.max())
+    ratio = np.full(demand_density.shape, np.nan)
+    ratio[covered] = supply['density'][covered] / demand_density[covered]
+    return {**supply, 'density': ratio, 'total': float(np.nanmedian(ratio)) if covered.any() else np.nan}
+
+def overlay_bounds(extent=UK_EXTENT):
+    """[[south, west], [north, east]] of a grid extent, for an ImageOverlay."""
+    west, south, east, north = _GRID_TO_LATLON.transform_bounds(*extent)
+    return [[south, west], [north, east]]
+
+def to_web_mercator(surface, width=None):
+    """
+    Resample a surface to an image that is regular in Web Mercator, so Leaflet can
+    stretch it over its lat/lon bounds without distortion.
+
+    Returns:
+        ndarray: (height, width) values with row 0 at the northern edge; NaN outside the grid
+    """
+    values = surface['density']
+    rows, cols = values.shape
+    (south, west), (north, east) = overlay_bounds(surface['extent'])
+    left, bottom = _LATLON_TO_MERCATOR.transform(west, south)
+    right, top = _LATLON_TO_MERCATOR.transform(east, north)
+
+    width = width or cols
+    height = int(round(width * (top - bottom) / (right - left)))
+    mx = left + (np.arange(width) + 0.5) * (right - left) / width
+    my = top - (np.arange(height) + 0.5) * (top - bottom) / height
+    x, y = _MERCATOR_TO_GRID.transform(*np.meshgrid(mx, my))
+
+    minx, miny, _, _ = surface['extent']
+    cell = surface['cell_km'] * 1000
+    col = np.floor((x - minx) / cell).astype(np.int64)
+    row = np.floor((y - miny) / cell).astype(np.int64)
+    inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+
+    image = np.full((height, width), np.nan)
+    image[inside] = values[row[inside], col[inside]]
+    return image
+
+def colorize(image, colors, vmin=None, vmax=None, log=False, opacity=0.75):
+    """
+    Map values to RGBA pixels along a colour ramp. NaN is transparent, and so are
+    densities in the bottom 1% of the ramp; log maps log2 of the values, for ratios.
+    """
+    if log:
+        with np.errstate(divide='ignore'):
+            values = np.log2(image)
+    else:
+        values = image
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.zeros(image.shape + (4,), dtype=np.uint8)
+    if vmin is None:
+        vmin = np.nanpercentile(values[finite], 1) if log else 0.0
+    if log:
+        # zero supply is the far end of the ramp, not missing data
+        values = np.where(values == -np.inf, vmin, values)
+        finite = np.isfinite(values)
+    if vmax is None:
+        vmax = np.nanpercentile(values[finite], 99.5) if finite.any() else 1.0
+    scaled = np.clip((values - vmin) / max(vmax - vmin, 1e-12), 0, 1)
+
+    ramp = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype=float)
+    stops = np.linspace(0, 1, len(colors))
+    rgba = np.zeros(image.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(np.nan_to_num(scaled), stops, ramp[:, channel]).astype(np.uint8)
+    visible = finite if log else finite & (scaled > 0.01)
+    rgba[..., 3] = np.where(visible, int(255 * opacity), 0)
+    return rgba
+
+def surface_key(kind, params, source_paths=()):
+    """Cache key for a surface: its kind, parameters and the fingerprints of its source files."""
+    fingerprints = [
+        [path, os.stat(path).st_mtime_ns, os.stat(path).st_size] if os.path.exists(path) else [path, None, None]
+        for path in source_paths
+    ]
+    payload = json.dumps({'kind': kind, 'params': params, 'sources': fingerprints}, sort_keys=True, default=str)
+    return f"{kind}_{hashlib.sha1(payload.encode()).hexdigest()[:12]}"
+
+def surface_file(key, cache_dir=DENSITY_CACHE_DIR):
+    """Path of the .npz file holding a cached surface's arrays."""
+    return os.path.join(cache_dir, f"{key}.npz")
+
+def get_surface(key, compute, cache_dir=DENSITY_CACHE_DIR):
+    """Return the surface stored under key, computing and saving it on a miss."""
+    path = surface_file(key, cache_dir)
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used for prune_cache
+        with np.load(path) as stored:
+            return {
+                'density': stored['density'],
+                'extent': tuple(stored['extent'].tolist()),
+                'cell_km': float(stored['cell_km']),
+                'bandwidth_km': float(stored['bandwidth_km']),
+                'total': float(stored['total'])
+            }
+
+    surface = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **{name: np.asarray(value) for name, value in surface.items()})
+    os.replace(tmp_path, path)
+    prune_cache(key.split('_')[0], cache_dir=cache_dir)
+    return surface
+
+def prune_cache(kind, keep=MAX_CACHED_PER_KIND, cache_dir=DENSITY_CACHE_DIR):
+    """Delete the arrays and PNGs of all but the `keep` most recently used surfaces of a kind."""
+    if not os.path.isdir(cache_dir):
+        return
+    arrays = [name for name in os.listdir(cache_dir) if name.startswith(f"{kind}_") and name.endswith('.npz')]
+    arrays.sort(key=lambda name: os.path.getmtime(os.path.join(cache_dir, name)), reverse=True)
+    for name in arrays[keep:]:
+        key = name[:-len('.npz')]
+        for path in (surface_file(key, cache_dir), os.path.join(cache_dir, f"{key}.png")):
+            if os.path.exists(path):
+                os.remove(path)
+
+def surface_png(key, surface, colors, log=False, cache_dir=DENSITY_CACHE_DIR):
+    """Path of the surface rendered as a Web Mercator PNG, rendering it on a miss."""
+    path = os.path.join(cache_dir, f"{key}.png")
+    if not os.path.exists(path):
+        rgba = colorize(to_web_mercator(surface), colors, log=log)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(write_png(rgba))
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,139 @@
+import numpy as np
+
+TILE_SIZE = 256
+BIN_PIXELS = 4  # bin edge in screen pixels, well inside the heatmap's blur radius
+MAX_POINTS = 20000  # cap on the points sent to the browser per heatmap
+
+def bin_size_for_zoom(zoom, pixels=BIN_PIXELS):
+    """Bin edge in degrees that spans the given number of screen pixels at a zoom."""
+    return 360 / (TILE_SIZE * 2 ** zoom) * pixels
+
+def grid_sums(rows, cols, values, days=None):
+    """
+    Sum value columns over the occupied cells of an integer grid, optionally
+    keeping each day separate.
+
+    Returns:
+        tuple: (rows, cols, sums), plus days when given, with one entry per occupied
+        cell ordered by day and then cell
+    """
+    if len(rows) == 0:
+        return (rows, cols, values) if days is None else (rows, cols, values, days)
+
+    col_offset, row_offset = cols.min(), rows.min()
+    n_cols = cols.max() - col_offset + 1
+    cells = (rows - row_offset) * n_cols + (cols - col_offset)
+    if days is not None:
+        cells = (days - days.min()) * ((rows.max() - row_offset + 1) * n_cols) + cells
+    _, first, bins = np.unique(cells, return_index=True, return_inverse=True)
+    sums = np.column_stack([np.bincount(bins, weights=column) for column in values.T])
+    if days is None:
+        return rows[first], cols[first], sums
+    return rows[first], cols[first], sums, days[first]
+
+def binned_sums(latitudes, longitudes, weights, bin_deg):
+    """Point count, latitude sum, longitude sum and weight sum per occupied bin of a grid."""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    weights = np.ones(len(latitudes)) if weights is None else np.asarray(weights, dtype=float)
+
+    valid = np.isfinite(latitudes) & np.isfinite(longitudes) & np.isfinite(weights)
+    if not valid.any():
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 4))
+    latitudes, longitudes, weights = latitudes[valid], longitudes[valid], weights[valid]
+
+    rows = np.floor(latitudes / bin_deg).astype(np.int64)
+    cols = np.floor(longitudes / bin_deg).astype(np.int64)
+    values = np.column_stack([np.ones(len(latitudes)), latitudes, longitudes, weights])
+    return grid_sums(rows, cols, values)
+
+def sums_to_points(sums):
+    """[latitude, longitude, weight] rows located at the mean position of each bin's points."""
+    return np.column_stack([sums[:, 1] / sums[:, 0], sums[:, 2] / sums[:, 0], sums[:, 3]])
+
+def bin_points(latitudes, longitudes, weights=None, bin_deg=None, zoom=6):
+    """
+    Aggregate points into a regular latitude/longitude grid.
+
+    Args:
+        latitudes, longitudes (array-like): Point coordinates
+        weights (array-like): Point weights; each point counts 1 if None
+        bin_deg (float): Bin edge in degrees; defaults to the size for zoom
+        zoom (int): Map zoom used when bin_deg is not given
+
+    Returns:
+        ndarray: (n_bins, 3) rows of [latitude, longitude, weight] for each occupied
+        bin, located at the mean position of its points
+    """
+    if bin_deg is None:
+        bin_deg = bin_size_for_zoom(zoom)
+    _, _, sums = binned_sums(latitudes, longitudes, weights, bin_deg)
+    return sums_to_points(sums)
+
+def coarsen_to_points(rows, cols, sums, levels=0, max_points=MAX_POINTS):
+    """
+    Heatmap points from binned sums, after doubling the bin size `levels` times and
+    then until at most max_points bins are occupied.
+
+    Each doubling merges the bins of the previous grid, so the raw points are
+    never needed again.
+
+    Returns:
+        list: [latitude, longitude, weight] rows for folium's HeatMap
+    """
+    for _ in range(max(levels, 0)):
+        rows, cols, sums = grid_sums(rows // 2, cols // 2, sums)
+    while len(sums) > max_points:
+        rows, cols, sums = grid_sums(rows // 2, cols // 2, sums)
+    return sums_to_points(sums).tolist()
+
+def heatmap_points(latitudes, longitudes, weights=None, zoom=6, max_points=MAX_POINTS):
+    """
+    Weighted heatmap points binned for a zoom, doubling the bin size until at most
+    max_points bins are occupied.
+
+    Returns:
+        list: [latitude, longitude, weight] rows for folium's HeatMap
+    """
+    rows, cols, sums = binned_sums(latitudes, longitudes, weights, bin_size_for_zoom(zoom))
+    return coarsen_to_points(rows, cols, sums, max_points=max_points)
+
+def build_daily_bins(days, latitudes, longitudes, zoom):
+    """
+    Pre-aggregate points into (day, bin) counts so a date range can be summed without
+    the raw rows.
+
+    Args:
+        days (array-like): Integer day ordinals
+        latitudes, longitudes (array-like): Point coordinates
+        zoom (int): Finest zoom the bins are sized for
+
+    Returns:
+        dict: zoom, day (sorted ordinals), rows, cols and sums (count, latitude sum,
+        longitude sum, weight) with one entry per occupied day and bin
+    """
+    days = np.asarray(days, dtype=np.int64)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    valid = np.isfinite(latitudes) & np.isfinite(longitudes)
+    days, latitudes, longitudes = days[valid], latitudes[valid], longitudes[valid]
+
+    bin_deg = bin_size_for_zoom(zoom)
+    rows = np.floor(latitudes / bin_deg).astype(np.int64)
+    cols = np.floor(longitudes / bin_deg).astype(np.int64)
+    ones = np.ones(len(days))
+    values = np.column_stack([ones, latitudes, longitudes, ones])
+    rows, cols, sums, days = grid_sums(rows, cols, values, days)
+    return {'zoom': zoom, 'day': days, 'rows': rows, 'cols': cols, 'sums': sums}
+
+def window_bins(daily_bins, first_day, last_day):
+    """
+    Bins summed over the days first_day..last_day (inclusive), found by binary
+    search on the sorted day ordinals.
+
+    Returns:
+        tuple: (rows, cols, sums) with one entry per occupied bin
+    """
+    lo = np.searchsorted(daily_bins['day'], first_day, side='left')
+    hi = np.searchsorted(daily_bins['day'], last_day, side='right')
+    return grid_sums(daily_bins['rows'][lo:hi], daily_bins['cols'][lo:hi], daily_bins['sums'][lo:hi])
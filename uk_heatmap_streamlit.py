@@ -1,13 +1,88 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import folium
 from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 import os
+from density_surface import (DEMAND_COLORS, RATIO_COLORS, SUPPLY_COLORS, get_surface, kde_surface, overlay_bounds,
+                             ratio_surface, surface_file, surface_key, surface_png)
+from heatmap_binning import build_daily_bins, coarsen_to_points, heatmap_points, window_bins
+from viewport import build_point_index, bounds_from_map, needs_requery, pad_bounds, query_bounds
 
 st.set_page_config(layout="wide")
 st.title("UK Dentist Clinics & Customer Appointments Heatmaps")
 
+UK_CENTER, UK_ZOOM = [55.3781, -3.4360], 6
+HEAT_MAX_ZOOM = 13
+
+def file_version(path):
+    """Modification time of a file in nanoseconds, or None if it does not exist."""
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+@st.cache_resource(max_entries=8)
+def point_index(name, _points_df):
+    """
+    Latitude-sorted index of a point table; name identifies the table, its file
+    version and its filters, since the index holds positions into that exact table.
+    """
+    return build_point_index(_points_df["latitude"], _points_df["longitude"])
+
+def viewport_points(key, name, points_df):
+    """Rows inside the area last queried for this map, or all rows outside viewport mode."""
+    queried = st.session_state.get(f"{key}_queried")
+    if not viewport_mode or queried is None:
+        return points_df
+    return points_df.iloc[query_bounds(point_index(name, points_df), queried)]
+
+def viewport_map(key):
+    """A folium map opened at the view last reported for this map."""
+    if not viewport_mode:
+        return folium.Map(location=UK_CENTER, zoom_start=UK_ZOOM)
+    return folium.Map(
+        location=st.session_state.get(f"{key}_center", UK_CENTER),
+        zoom_start=st.session_state.get(f"{key}_zoom", UK_ZOOM)
+    )
+
+def heat_zoom(key):
+    """Zoom to bin a heatmap for: the current view in viewport mode, otherwise the closest zoom the heatmap draws."""
+    if viewport_mode:
+        return st.session_state.get(f"{key}_zoom", UK_ZOOM)
+    return HEAT_MAX_ZOOM
+
+def add_surface(m, key, surface, colors, name, log=False):
+    """Draw a cached density surface on a map as a PNG image overlay."""
+    folium.raster_layers.ImageOverlay(
+        image=surface_png(key, surface, colors, log=log),
+        bounds=overlay_bounds(surface["extent"]),
+        mercator_project=False,
+        name=name
+    ).add_to(m)
+
+def surface_details(key, surface, units):
+    """Caption and raw-array download for a density surface."""
+    density = surface["density"]
+    peak = density[np.isfinite(density)].max() if np.isfinite(density).any() else 0.0
+    st.caption(
+        f"Gaussian KDE, {surface['bandwidth_km']:g} km bandwidth on a {surface['cell_km']:g} km grid; "
+        f"peak {peak:,.2f} {units}"
+    )
+    with open(surface_file(key), "rb") as f:
+        st.download_button("Download surface array (.npz)", f.read(), file_name=f"{key}.npz", key=f"download_{key}")
+
+def show_map(key, m):
+    """Display a map; in viewport mode, re-query its points once the view moves past the queried area."""
+    if not viewport_mode:
+        st_folium(m, width="100%", height=600, key=key)
+        return
+    map_state = st_folium(m, width="100%", height=600, key=key, returned_objects=["bounds", "zoom"])
+    view = bounds_from_map(map_state)
+    if needs_requery(st.session_state.get(f"{key}_queried"), view):
+        st.session_state[f"{key}_queried"] = pad_bounds(view)
+        st.session_state[f"{key}_zoom"] = map_state.get("zoom") or UK_ZOOM
+        st.session_state[f"{key}_center"] = [(view[0] + view[2]) / 2, (view[1] + view[3]) / 2]
+        st.rerun()
+
 # 1) Dentist clinics
 dentist_file = "dentist_data_map.csv"
 if os.path.exists(dentist_file):
@@ -20,66 +95,140 @@ else:
         "weekly_availability_hours": [100, 150, 80],
     })
 
-map_dent = folium.Map(location=[55.3781, -3.4360], zoom_start=6)
-heat_dent = [
-    [r.latitude, r.longitude, r.weekly_availability_hours]
-    for r in df_dent.itertuples()
-]
-HeatMap(heat_dent, radius=15, max_zoom=13).add_to(map_dent)
+# Viewport mode sends only the points around the visible area to the browser
+viewport_mode = st.sidebar.checkbox(
+    "Viewport mode",
+    help="Send only the points in and around the current map view; panning or zooming further re-queries them"
+)
+
+# Density surfaces: server-side kernel density in km rather than Leaflet's zoom-dependent heatmap
+surface_mode = st.sidebar.checkbox(
+    "Density surfaces",
+    help="Draw clinic hours and appointments as kernel density surfaces with a fixed bandwidth in km"
+)
+bandwidth_km = st.sidebar.slider("Bandwidth (km)", min_value=2, max_value=50, value=10, disabled=not surface_mode)
+
+map_dent = viewport_map("map_dent")
+if surface_mode:
+    supply_key = surface_key("supply", {"bandwidth_km": bandwidth_km}, [dentist_file])
+    supply_surface = get_surface(supply_key, lambda: kde_surface(
+        df_dent["latitude"], df_dent["longitude"], df_dent["weekly_availability_hours"], bandwidth_km
+    ))
+    add_surface(map_dent, supply_key, supply_surface, SUPPLY_COLORS, "Clinic hours density")
+else:
+    df_dent_view = viewport_points("map_dent", (dentist_file, file_version(dentist_file)), df_dent)
+    heat_dent = heatmap_points(
+        df_dent_view["latitude"], df_dent_view["longitude"], df_dent_view["weekly_availability_hours"],
+        zoom=heat_zoom("map_dent")
+    )
+    HeatMap(heat_dent, radius=15, max_zoom=HEAT_MAX_ZOOM).add_to(map_dent)
 
 # Customer appointments 
 cust_file = "customers_with_latlon_cleaned.csv"
-if os.path.exists(cust_file):
-    df_cust = pd.read_csv(cust_file, low_memory=False)
-else:
+if not os.path.exists(cust_file):
     st.error(f"Could not find `{cust_file}` in the project folder.")
     st.stop()
 
 date_col = "assigned_date"
 
-# parse it into datetime
-df_cust[date_col] = pd.to_datetime(df_cust[date_col], errors="coerce")
-df_cust = df_cust.dropna(subset=[date_col])
+@st.cache_resource(max_entries=1, show_spinner="Aggregating customer appointments...")
+def load_customer_bins(path, mtime_ns):
+    """
+    Parse the customer file once per version into (day, bin) appointment counts.
+    Date ranges are then summed from this table without touching the raw rows.
+
+    Cached as a resource, so every rerun and session shares the arrays without
+    copying them; they must be treated as read-only.
+    """
+    df_cust = pd.read_csv(path, low_memory=False)
+
+    # parse it into datetime
+    df_cust[date_col] = pd.to_datetime(df_cust[date_col], errors="coerce")
+    df_cust = df_cust.dropna(subset=[date_col])
+
+    day_start = df_cust[date_col].dt.normalize()
+
+    days = day_start.to_numpy().astype("datetime64[D]").astype(np.int64)
+    bins = build_daily_bins(days, df_cust["latitude"], df_cust["longitude"], zoom=HEAT_MAX_ZOOM)
+    bins["min_date"] = day_start.min().date()
+    bins["max_date"] = day_start.max().date()
+    return bins
 
-# for possible weekly grouping later
-df_cust["week_start"] = df_cust[date_col].dt.to_period("W").apply(lambda r: r.start_time)
+def day_ordinal(date):
+    """Days since 1970-01-01, the ordinal used by the daily bins."""
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+cust_version = file_version(cust_file)
+customer_bins = load_customer_bins(cust_file, cust_version)
 
 # Sidebar date selectors
 st.sidebar.header("Customer Heatmap Date Range")
-min_date = df_cust[date_col].dt.date.min()
-max_date = df_cust[date_col].dt.date.max()
+min_date = customer_bins["min_date"]
+max_date = customer_bins["max_date"]
 start_date = st.sidebar.date_input("Start date", value=min_date, min_value=min_date, max_value=max_date)
 end_date   = st.sidebar.date_input("End date",   value=max_date, min_value=min_date, max_value=max_date)
 if start_date > end_date:
     st.sidebar.error("Start date must be on or before end date")
 
-# filter & group by lat/lon
-mask = (
-    (df_cust[date_col].dt.date >= start_date) &
-    (df_cust[date_col].dt.date <= end_date)
-)
-df_filt = df_cust.loc[mask]
-df_grp = (
-    df_filt
-    .groupby(["latitude", "longitude"], as_index=False)
-    .size()
-    .rename(columns={"size": "count"})
-)
+# sum the pre-aggregated bins over the selected days
+bin_rows, bin_cols, bin_sums = window_bins(customer_bins, day_ordinal(start_date), day_ordinal(end_date))
+df_filt = pd.DataFrame({
+    "latitude": bin_sums[:, 1] / bin_sums[:, 0],
+    "longitude": bin_sums[:, 2] / bin_sums[:, 0],
+    "count": bin_sums[:, 3]
+})
+total_appointments = int(df_filt["count"].sum())
 
-map_cust = folium.Map(location=[55.3781, -3.4360], zoom_start=6)
-heat_cust = [
-    [r.latitude, r.longitude, r.count]
-    for r in df_grp.itertuples()
-]
-HeatMap(heat_cust, radius=15, max_zoom=13).add_to(map_cust)
+map_cust = viewport_map("map_cust")
+if surface_mode:
+    demand_key = surface_key(
+        "demand", {"bandwidth_km": bandwidth_km, "start": start_date, "end": end_date}, [cust_file]
+    )
+    demand_surface = get_surface(demand_key, lambda: kde_surface(
+        df_filt["latitude"], df_filt["longitude"], df_filt["count"], bandwidth_km=bandwidth_km
+    ))
+    add_surface(map_cust, demand_key, demand_surface, DEMAND_COLORS, "Appointment density")
+else:
+    in_view = viewport_points("map_cust", (cust_file, cust_version, start_date, end_date), df_filt).index.to_numpy()
+    view_appointments = int(df_filt["count"].to_numpy()[in_view].sum())
+    heat_cust = coarsen_to_points(
+        bin_rows[in_view], bin_cols[in_view], bin_sums[in_view],
+        levels=HEAT_MAX_ZOOM - heat_zoom("map_cust")
+    )
+    HeatMap(heat_cust, radius=15, max_zoom=HEAT_MAX_ZOOM).add_to(map_cust)
+
+# Supply/demand: clinic hours per appointment, on the shared density grid
+tab_names = ["Clinics Availability", "Customer Appointments"]
+if surface_mode:
+    ratio_key = surface_key("ratio", {"supply": supply_key, "demand": demand_key})
+    ratio = get_surface(ratio_key, lambda: ratio_surface(supply_surface, demand_surface))
+    map_ratio = viewport_map("map_ratio")
+    add_surface(map_ratio, ratio_key, ratio, RATIO_COLORS, "Supply / demand", log=True)
+    tab_names.append("Supply / Demand")
 
-tab1, tab2 = st.tabs(["Clinics Availability", "Customer Appointments"])
+tabs = st.tabs(tab_names)
 
-with tab1:
+with tabs[0]:
     st.header("Weekly Availability of Dentist Clinics")
-    st_folium(map_dent, width="100%", height=600)
+    if surface_mode:
+        surface_details(supply_key, supply_surface, "weekly hours per km²")
+    show_map("map_dent", map_dent)
 
-with tab2:
+with tabs[1]:
     st.header(f"Customer Appointments from {start_date} to {end_date}")
-    st.markdown(f"**Total appointments:** {len(df_filt)}")
-    st_folium(map_cust, width="100%", height=600)
+    st.markdown(f"**Total appointments:** {total_appointments}")
+    if surface_mode:
+        surface_details(demand_key, demand_surface, "appointments per km²")
+    else:
+        if viewport_mode and view_appointments < total_appointments:
+            st.caption(f"Showing {view_appointments:,} of {total_appointments:,} appointments around the current view")
+        st.caption(f"{len(heat_cust):,} heatmap bins")
+    show_map("map_cust", map_cust)
+
+if surface_mode:
+    with tabs[2]:
+        st.header(f"Clinic Hours per Appointment, {start_date} to {end_date}")
+        st.markdown("Red areas have few clinic hours for their demand; green areas are well supplied. "
+                    "Areas with almost no appointments are left blank.")
+        surface_details(ratio_key, ratio, "weekly hours per appointment")
+        show_map("map_ratio", map_ratio)
@@ -0,0 +1,66 @@
+import numpy as np
+
+DEFAULT_MARGIN = 0.25  # extra fraction of the view queried on each side
+REQUERY_SHRINK = 0.25  # re-query once the view covers less than this share of the queried area
+
+def build_point_index(latitudes, longitudes):
+    """
+    Index points by latitude so a bounding-box query only scans one latitude band.
+
+    Returns:
+        dict: order (positions sorted by latitude), lat and lon (sorted copies)
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    order = np.argsort(latitudes, kind='stable')
+    return {
+        'order': order,
+        'lat': latitudes[order],
+        'lon': np.asarray(longitudes, dtype=float)[order]
+    }
+
+def query_bounds(index, bounds):
+    """Positions (in the original order) of the points inside (south, west, north, east)."""
+    south, west, north, east = bounds
+    lo = np.searchsorted(index['lat'], south, side='left')
+    hi = np.searchsorted(index['lat'], north, side='right')
+    lon = index['lon'][lo:hi]
+    inside = (lon >= west) & (lon <= east)
+    return np.sort(index['order'][lo:hi][inside])
+
+def bounds_from_map(map_state):
+    """(south, west, north, east) from the bounds st_folium returns, or None before the map reports them."""
+    bounds = (map_state or {}).get('bounds') or {}
+    south_west, north_east = bounds.get('_southWest') or {}, bounds.get('_northEast') or {}
+    values = (south_west.get('lat'), south_west.get('lng'), north_east.get('lat'), north_east.get('lng'))
+    if any(value is None for value in values):
+        return None
+    return tuple(float(value) for value in values)
+
+def pad_bounds(bounds, margin=DEFAULT_MARGIN):
+    """Grow bounds by a fraction of their height and width on every side."""
+    south, west, north, east = bounds
+    dlat, dlon = (north - south) * margin, (east - west) * margin
+    return south - dlat, west - dlon, north + dlat, east + dlon
+
+def bounds_area(bounds):
+    """Area of bounds in square degrees."""
+    south, west, north, east = bounds
+    return max(north - south, 0) * max(east - west, 0)
+
+def needs_requery(queried_bounds, view_bounds, shrink=REQUERY_SHRINK):
+    """
+    Whether the data for a new view must be re-queried.
+
+    Small pans and zooms stay inside the padded area already queried and reuse it;
+    the query is redone when the view leaves that area or zooms in far enough that
+    most of the queried points are off screen.
+    """
+    if view_bounds is None:
+        return False
+    if queried_bounds is None:
+        return True
+    south, west, north, east = view_bounds
+    q_south, q_west, q_north, q_east = queried_bounds
+    if south < q_south or west < q_west or north > q_north or east > q_east:
+        return True
+    return bounds_area(view_bounds) < shrink * bounds_area(queried_bounds)